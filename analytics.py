@@ -0,0 +1,119 @@
+import threading
+
+import pandas as pd
+
+import database
+
+# Timestamps are stored in UTC; periods are cut in the dashboard's timezone
+ANALYTICS_TIMEZONE = "Asia/Kolkata"
+
+# Supported trend periods: label -> NumPy datetime unit of the period start
+PERIODS = {"Weekly": "W", "Monthly": "M"}
+
+CONSUMPTION_COLUMNS = ["created_at", "department", "item_id", "item", "quantity"]
+
+_cache_lock = threading.Lock()
+_consumption_cache = {"version": None, "frame": None, "trends": {}}
+
+
+def _data_version():
+    return (database.get_data_version(database.REQUESTS), database.get_data_version(database.CATALOGUE))
+
+
+def period_start(timestamps, period):
+    """Maps timestamps to the start of their week (Monday) or month.
+
+    Args:
+        timestamps (pandas.Series): Naive datetime64 values.
+        period (str): "W" or "M".
+
+    Returns:
+        numpy.ndarray: datetime64[D] period starts, one per timestamp.
+    """
+    days = timestamps.to_numpy().astype("datetime64[D]")
+    if period == "M":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays
+    offsets = (days.view("int64") + 3) % 7
+    return days - offsets.astype("timedelta64[D]")
+
+
+def load_consumption():
+    """Returns every issued request line as a DataFrame, rebuilt only when requests or items change.
+
+    Returns:
+        pandas.DataFrame: created_at (local time), department, item_id, item and quantity columns.
+            The frame is shared between sessions and must not be modified.
+    """
+    version = _data_version()
+    cache = _consumption_cache
+    if cache["version"] == version:
+        return cache["frame"]
+    with _cache_lock:
+        if _consumption_cache["version"] == version:
+            return _consumption_cache["frame"]
+        rows = database.get_consumption_records()
+        frame = pd.DataFrame.from_records(rows, columns=CONSUMPTION_COLUMNS)
+        # Explicit dtypes keep the aggregations numeric when there are no rows
+        frame = frame.astype({"item_id": "int64", "quantity": "int64"})
+        frame["created_at"] = (
+            pd.to_datetime(frame["created_at"], format="%Y-%m-%d %H:%M:%S", utc=True)
+            .dt.tz_convert(ANALYTICS_TIMEZONE)
+            .dt.tz_localize(None)
+        )
+        frame["department"] = frame["department"].astype("category")
+        frame["item"] = frame["item"].astype("category")
+        _consumption_cache.update(version=version, frame=frame, trends={})
+        return frame
+
+
+def consumption_trends(period="W"):
+    """Aggregates issued quantities per period, department and item.
+
+    Args:
+        period (str): "W" for weeks starting Monday or "M" for calendar months.
+
+    Returns:
+        pandas.DataFrame: period, department, item and quantity columns, sorted by period.
+            Cached with the consumption frame; must not be modified.
+    """
+    frame = load_consumption()
+    cache = _consumption_cache
+    trends = cache["trends"] if cache["frame"] is frame else {}
+    if period in trends:
+        return trends[period]
+    grouped = (
+        frame.assign(period=period_start(frame["created_at"], period))
+        .groupby(["period", "department", "item"], observed=True, sort=True)["quantity"]
+        .sum()
+        .reset_index()
+    )
+    trends[period] = grouped
+    return grouped
+
+
+def department_totals(trends):
+    """Pivots a consumption_trends() frame into one column per department.
+
+    Args:
+        trends (pandas.DataFrame): Output of consumption_trends().
+
+    Returns:
+        pandas.DataFrame: Total quantity issued, indexed by period.
+    """
+    return trends.pivot_table(index="period", columns="department", values="quantity",
+                              aggfunc="sum", fill_value=0, observed=True)
+
+
+def top_items(trends, limit=10):
+    """Returns the most consumed items over a trends frame.
+
+    Args:
+        trends (pandas.DataFrame): Output of consumption_trends(), optionally filtered.
+        limit (int): Number of items to return.
+
+    Returns:
+        pandas.DataFrame: item and quantity columns, largest first.
+    """
+    totals = trends.groupby("item", observed=True)["quantity"].sum()
+    return totals.nlargest(limit).rename_axis("item").reset_index()
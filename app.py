@@ -3,21 +3,34 @@ import re
 import datetime
 import time
 import pytz
-from mail import send_email  # Assuming this exists from your original code
+from contextlib import contextmanager
+from mail import (
+    send_bulk_email, queue_email, start_outbox_worker, check_email_address,
+    start_digest_scheduler, send_department_digests, DIGEST_WINDOW
+)
+from email_validator import EmailNotValidError
+from analytics import PERIODS, consumption_trends, department_totals, top_items
+from profiling import profiler
 
 from database import (
     register_user,
-    login_user,
+    authenticate_principal,
     get_all_items,
     insert_request,
     get_requests_by_emp_id,
-    get_all_requests,
+    get_request,
+    get_requests_by_status,
+    get_request_status_counts,
     update_request_status,
+    approve_request,
     delete_request,
     update_item_quantity,
-    get_request_items,
+    get_stock_as_of,
+    get_item_consumption,
+    get_stock_movements,
     get_all_users,
     get_requests_by_department,
+    get_department_requester_emails,
     delete_user,
     update_user_password,
     add_item,
@@ -33,6 +46,18 @@ from database import (
     update_store_password,
     get_department_emails,
     update_department_email,
+    REQUEST_STATUSES,
+    page_cursor,
+    get_outbox_summary,
+    get_outbox_messages,
+    requeue_emails,
+    OUTBOX_STATUSES,
+    get_pending_notification_events,
+    get_query_stats,
+    reset_query_stats,
+    configure_query_stats,
+    dump_query_stats,
+    get_pool_stats,
 )
 
 # Load external CSS
@@ -48,36 +73,31 @@ SUPER_ADMIN_EMAIL = "123@ceat.com"
 SUPER_ADMIN_PASSWORD = "Ceat@123"  # Changed to SUPER_ADMIN_PASSWORD for clarity
 DISPLAY_TIMEZONE = 'Asia/Kolkata'
 
-if 'DEPARTMENTS' not in st.session_state:
-    st.session_state.DEPARTMENTS = [
-        "FJS", "MIXTURE", "MIXTURE QLF LAB", "TBR STOCK", "PCR STOCK",
-        "TBR STOCK ELECTRICAL MAINTENANCE", "TBR STOCK MECHANICAL MAINTENANCE",
-        "PCR STOCK ELECTRICAL MAINTENANCE", "PCR STOCK MECHANICAL MAINTENANCE",
-        "ACADEMY", "PM SELL", "PCR BUILDING", "TBR BUILDING",
-        "PCR BUILDING ELECTRICAL MAINTENANCE", "TBR CURING/FF", "PCR CURING/FF",
-        "HR", "PROJECT", "PURCHASE", "STORE", "FINANCE", "DIGITAL", "IT"
-    ]
-
-if 'DEPARTMENT_HEADS' not in st.session_state:
-    db_dept_heads = get_all_department_heads()
-    if not db_dept_heads:
-        initial_dept_heads = {
-            dept: {"username": dept.lower().replace(" ", "_"), "password": dept.lower().replace(" ", "_") + "123", "email": ""}
-            for dept in st.session_state.DEPARTMENTS
-        }
-        for dept, creds in initial_dept_heads.items():
-            add_department_head(dept, creds["username"], creds["password"], creds["email"])
-        st.session_state.DEPARTMENT_HEADS = initial_dept_heads
-    else:
-        st.session_state.DEPARTMENT_HEADS = db_dept_heads
+DEFAULT_DEPARTMENTS = [
+    "FJS", "MIXTURE", "MIXTURE QLF LAB", "TBR STOCK", "PCR STOCK",
+    "TBR STOCK ELECTRICAL MAINTENANCE", "TBR STOCK MECHANICAL MAINTENANCE",
+    "PCR STOCK ELECTRICAL MAINTENANCE", "PCR STOCK MECHANICAL MAINTENANCE",
+    "ACADEMY", "PM SELL", "PCR BUILDING", "TBR BUILDING",
+    "PCR BUILDING ELECTRICAL MAINTENANCE", "TBR CURING/FF", "PCR CURING/FF",
+    "HR", "PROJECT", "PURCHASE", "STORE", "FINANCE", "DIGITAL", "IT"
+]
+
+# Department heads and the admin/store credentials are read from the
+# process-wide principal cache in database.py, so sessions hold no copies
+# and super-admin edits apply to every session at once.
+if not get_all_department_heads():
+    for dept in DEFAULT_DEPARTMENTS:
+        username = dept.lower().replace(" ", "_")
+        add_department_head(dept, username, username + "123", "")
 
-if 'ADMIN_CREDENTIALS' not in st.session_state:
-    st.session_state.ADMIN_CREDENTIALS = get_admin_credentials()
+def get_departments():
+    return list(get_all_department_heads())
 
-if 'STORE_CREDENTIALS' not in st.session_state:
-    st.session_state.STORE_CREDENTIALS = get_store_credentials()
 
-DEPARTMENT_EMAILS = {dept: "" for dept in st.session_state.DEPARTMENTS}
+# Notification emails are delivered in the background from the outbox;
+# department heads also get a periodic digest of their department's request updates
+start_outbox_worker()
+start_digest_scheduler()
 
 def format_timestamp(timestamp_str, tz_name=DISPLAY_TIMEZONE):
     if not timestamp_str:
@@ -97,18 +117,195 @@ def format_timestamp(timestamp_str, tz_name=DISPLAY_TIMEZONE):
         print(f"Error parsing timestamp: {timestamp_str} - {e}")
         return f"Invalid date ({timestamp_str})"
 
-def show_loading_animation(placeholder, message="Processing..."):
-    placeholder.markdown(
-        """
-        <div class="loading-container">
-            <img src="https://blogger.googleusercontent.com/img/a/AVvXsEj3RLW4UZW49PBvV7pWj15YHMUuWCy49nXiRXzUuGc73_FBhacqQ6O5DnXRGwoyXAS2ZcEPoECGqVpTF2pqWuvakOEEZhbQ_iRNtQ8oYAMfviKUGhvPB3pCMX7iUnrU4KbNw8Zot0yxAZpztyLyZldljv-XRTJTYGs6xTsd8TSuVPUyrC8qfLab5kTTZQ4" 
-                 alt="Loading..." style="width: 100px; height: 100px; display: block; margin: 0 auto;">
-            <p style="text-align: center; color: #333;">{}</p>
-        </div>
-        """.format(message),
-        unsafe_allow_html=True
-    )
-    time.sleep(2)
+class OperationTimer:
+    """Records how long each stage of a dashboard action takes."""
+
+    def __init__(self, message):
+        self.message = message
+        self.stages = []
+        self.started = time.perf_counter()
+        self.total = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def summary(self):
+        parts = [f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.stages]
+        return f"{self.message} {self.total * 1000:.0f} ms ({', '.join(parts) if parts else 'no stages'})"
+
+@contextmanager
+def track_operation(message):
+    """Shows a status box while a dashboard action runs and records its timing.
+
+    Args:
+        message (str): Label shown while the action runs (e.g. "Approving request...").
+
+    Yields:
+        OperationTimer: Wrap each step in timer.stage("database") / timer.stage("email").
+
+    Notes:
+        The status box closes as soon as the work finishes, in the error state if the work raised
+        (the exception is re-raised). The timing breakdown is printed to the server log and kept in st.session_state.last_operation_timing, which display_header
+        shows after the page reruns.
+    """
+    timer = OperationTimer(message.rstrip("."))
+    # Not entered as a container, so messages from the action render in place
+    status = st.status(message)
+    failed = False
+    try:
+        yield timer
+    except Exception:
+        failed = True
+        raise
+    finally:
+        timer.finish()
+        st.session_state.last_operation_timing = timer.summary()
+        print(f"Timing: {timer.summary()}")
+        for name, seconds in timer.stages:
+            status.write(f"{name}: {seconds * 1000:.0f} ms")
+        if failed:
+            status.update(label=f"{timer.message} failed after {timer.total * 1000:.0f} ms", state="error")
+        else:
+            status.update(label=f"{timer.message} took {timer.total * 1000:.0f} ms", state="complete")
+
+PAGE_SIZE_OPTIONS = [10, 20, 50, 100]
+DEFAULT_PAGE_SIZE = 20
+
+def _reset_pagination(key):
+    st.session_state[f"{key}_cursors"] = [None]
+
+def _next_page(key, cursor):
+    st.session_state[f"{key}_cursors"].append(cursor)
+
+def _previous_page(key):
+    if len(st.session_state[f"{key}_cursors"]) > 1:
+        st.session_state[f"{key}_cursors"].pop()
+
+def paginate_requests(key, fetch_page):
+    """Fetches one page of requests and renders the page controls.
+
+    Args:
+        key (str): Unique prefix for the widget and session state keys of this list.
+        fetch_page (callable): Called as fetch_page(limit, before) and returns requests newest first.
+
+    Returns:
+        list: The requests on the current page.
+    """
+    if f"{key}_cursors" not in st.session_state:
+        _reset_pagination(key)
+    cursors = st.session_state[f"{key}_cursors"]
+
+    col1, col2, col3, col4 = st.columns([2, 1, 2, 1])
+    with col1:
+        page_size = st.selectbox(
+            "Requests per page",
+            options=PAGE_SIZE_OPTIONS,
+            index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE),
+            key=f"{key}_page_size",
+            on_change=_reset_pagination,
+            args=(key,)
+        )
+
+    # One extra row tells us whether a next page exists
+    requests = fetch_page(page_size + 1, cursors[-1]) or []
+    has_next = len(requests) > page_size
+    requests = requests[:page_size]
+
+    with col2:
+        st.button("Previous", key=f"{key}_prev", disabled=len(cursors) == 1,
+                  on_click=_previous_page, args=(key,))
+    with col3:
+        st.write(f"Page {len(cursors)}")
+    with col4:
+        st.button("Next", key=f"{key}_next", disabled=not has_next,
+                  on_click=_next_page, args=(key, page_cursor(requests[-1]) if requests else None))
+    return requests
+
+# Request cards on the department head, admin and store dashboards are fragments
+# keyed by request id, so an action reruns its card and the summary, not the page
+REQUEST_SUMMARY_KEY = "request_summary"
+
+def request_card_key(req_id):
+    return f"request_card_{req_id}"
+
+@st.fragment(key=REQUEST_SUMMARY_KEY)
+def request_summary(statuses, department=None):
+    """Shows how many requests are in each status; card actions rerun it.
+
+    Args:
+        statuses (list): Statuses to count, in display order.
+        department (str, optional): Only count this department's requests.
+    """
+    with profiler.run("request_summary"):
+        counts = get_request_status_counts(statuses, department)
+        for col, status in zip(st.columns(len(statuses)), statuses):
+            col.metric(status, counts[status])
+
+def render_request_cards(requests, render_card):
+    """Renders each request of a page as its own fragment.
+
+    Args:
+        requests (list): Requests on the current page.
+        render_card (callable): Called as render_card(req) inside the card's fragment.
+
+    Notes:
+        Card buttons call run_card_action, which reruns only that card and request_summary,
+        so request_summary must be on the page too.
+    """
+    # The page was just fetched, so rows refreshed by earlier card actions are stale
+    st.session_state.request_card_rows = {}
+    st.session_state.setdefault("request_card_notices", {})
+    for req in requests:
+        st.fragment(_request_card, key=request_card_key(req["id"]))(req, render_card)
+
+def _request_card(req, render_card):
+    req_id = req["id"]
+    with profiler.run("request_card"):
+        # Fragment reruns get the page's row again; prefer the copy refreshed by an action
+        req = st.session_state.request_card_rows.get(req_id, req)
+        if req is not None:
+            render_card(req)
+        notice = st.session_state.request_card_notices.pop(req_id, None)
+        if notice:
+            level, text, timing = notice
+            getattr(st, level)(text)
+            st.caption(f"Last action: {timing}")
+        elif req is None:
+            st.caption(f"Request {req_id} was deleted.")
+
+def run_card_action(req_id, message, action, *args):
+    """Button callback that runs a request card action and reruns only that card and the summary.
+
+    Args:
+        req_id (int): Request shown by the card.
+        message (str): Action name used in the timing summary (e.g. "Approving request").
+        action (callable): Called as action(timer, *args); returns (level, text) where level is
+            "success", "warning" or "error".
+        *args: Passed on to action.
+
+    Notes:
+        Callbacks run before the rerun, so instead of a status box the card shows the result and
+        timing below itself. The timing is also kept in st.session_state.last_operation_timing.
+    """
+    timer = OperationTimer(message)
+    try:
+        level, text = action(timer, *args)
+    except Exception as e:
+        level, text = "error", f"{message} failed for request {req_id}: {e}"
+    timer.finish()
+    st.session_state.last_operation_timing = timer.summary()
+    print(f"Timing: {timer.summary()}")
+    st.session_state.request_card_rows[req_id] = get_request(req_id)
+    st.session_state.request_card_notices[req_id] = (level, text, timer.summary())
+    st.rerun([request_card_key(req_id), REQUEST_SUMMARY_KEY])
 
 if 'page' not in st.session_state:
     st.session_state.clear()
@@ -125,15 +322,18 @@ if 'page' not in st.session_state:
 
 def validate_email(email):
     email_regex = r'^[a-zA-Z0-9_.+-]+@(ceat\.com|gmail\.com)$'
-    return re.match(email_regex, email) is not None
-
-def authenticate_dept_head(username, password):
-    for dept, creds in st.session_state.DEPARTMENT_HEADS.items():
-        if creds["username"] == username and creds["password"] == password:
-            return dept
-    return None
+    if re.match(email_regex, email) is None:
+        return False
+    # Full check (DNS unless offline validation is configured) at write time, so sends skip it
+    try:
+        check_email_address(email)
+        return True
+    except EmailNotValidError:
+        return False
 
 def display_header(info=None):
+    if st.session_state.get("last_operation_timing"):
+        st.caption(f"Last action: {st.session_state.last_operation_timing}")
     cols = st.columns([110, 40])
     with cols[0]:
         if info:
@@ -173,34 +373,34 @@ def login():
                 st.session_state.user_details = {"email": email, "emp_id": "SUPER_ADMIN"}
                 st.session_state.page = "super_admin_dashboard"
                 st.rerun()
-            elif email == st.session_state.ADMIN_CREDENTIALS["username"] and password == st.session_state.ADMIN_CREDENTIALS["password"]:
+            # One indexed query finds the admin, store, department head or user account
+            elif (principal := authenticate_principal(email, password)) is None:
+                st.error("Invalid email or password.")
+            elif principal["role"] == "admin":
                 st.session_state.is_admin = True
                 st.session_state.user_details = {"username": email}
                 st.session_state.page = "admin_dashboard"
                 st.rerun()
-            elif email == st.session_state.STORE_CREDENTIALS["username"] and password == st.session_state.STORE_CREDENTIALS["password"]:
+            elif principal["role"] == "store":
                 st.session_state.is_store = True
                 st.session_state.user_details = {"username": email}
                 st.session_state.page = "store_dashboard"
                 st.rerun()
-            elif dept := authenticate_dept_head(email, password):
+            elif principal["role"] == "dept_head":
+                dept = principal["department"]
                 st.session_state.is_dept_head = True
                 st.session_state.dept_head_department = dept
                 st.session_state.user_details = {"username": email, "department": dept}
                 st.session_state.page = "dept_head_dashboard"
                 st.rerun()
             else:
-                user = login_user(email, password)
-                if user:
-                    st.session_state.is_user_logged_in = True
-                    st.session_state.user_details = {
-                        "email": user["email"],
-                        "emp_id": user["emp_id"]
-                    }
-                    st.session_state.page = "user_dashboard"
-                    st.rerun()
-                else:
-                    st.error("Invalid email or password.")
+                st.session_state.is_user_logged_in = True
+                st.session_state.user_details = {
+                    "email": principal["login"],
+                    "emp_id": principal["emp_id"]
+                }
+                st.session_state.page = "user_dashboard"
+                st.rerun()
 
     if go_to_register_btn:
         st.session_state.page = "register"
@@ -254,7 +454,7 @@ def user_request_form():
 
     st.selectbox(
         "Select Department",
-        options=sorted(st.session_state.DEPARTMENTS),
+        options=sorted(get_departments()),
         key="selected_department"
     )
     if "selected_department" in st.session_state:
@@ -264,10 +464,11 @@ def user_request_form():
         st.session_state.selected_items = {}
 
     items = get_all_items() or []
-    item_map = {item["id"]: {"particular": item["particular"], "quantity": item["quantity"]} for item in items}
+    # Stock held by other open requests is not offered again
+    item_map = {item["id"]: {"particular": item["particular"], "quantity": item["available"]} for item in items}
 
     with st.expander("Add Items", expanded=True):
-        available_item_ids = [None] + [item["id"] for item in items if item["id"] not in st.session_state.selected_items and item["quantity"] > 0]
+        available_item_ids = [None] + [item["id"] for item in items if item["id"] not in st.session_state.selected_items and item["available"] > 0]
         selected_item_id = st.selectbox(
             "Select item to add",
             options=available_item_ids,
@@ -324,50 +525,50 @@ def user_request_form():
             selected_items_list = [{"item_id": k, "quantity": v} for k, v in st.session_state.selected_items.items()]
             user_details = st.session_state.user_details
 
-            animation_placeholder = st.empty()
-            show_loading_animation(animation_placeholder, "Processing your request...")
-            
-            success, message = insert_request(
-                user_name,
-                user_details["email"],
-                user_details["emp_id"],
-                user_details["department"],
-                selected_items_list,
-                formatted_description,
-                suggestion if suggestion.strip() else None
-            )
+            with track_operation("Processing your request...") as timer:
+                with timer.stage("database"):
+                    success, message = insert_request(
+                        user_name,
+                        user_details["email"],
+                        user_details["emp_id"],
+                        user_details["department"],
+                        selected_items_list,
+                        formatted_description,
+                        suggestion if suggestion.strip() else None
+                    )
 
-            if success:
-                requests = get_requests_by_emp_id(user_details["emp_id"])
-                latest_request = max(requests, key=lambda x: x["created_at"]) if requests else None
-                req_id = latest_request["id"] if latest_request else "Unknown"
+                if success:
+                    with timer.stage("database"):
+                        requests = get_requests_by_emp_id(user_details["emp_id"], limit=1)
+                    latest_request = requests[0] if requests else None
+                    req_id = latest_request["id"] if latest_request else "Unknown"
 
-                subject = f"Request {req_id} Submitted"
-                body = f"Your request has been successfully submitted and is pending department approval.\n\nDetails:\n{formatted_description}"
-                try:
-                    send_email(
-                        to_email=user_details["email"],
-                        admin_name="System",
-                        subject=subject,
-                        body=body,
-                        request_details={
-                            "id": req_id,
-                            "description": formatted_description,
-                            "status": "Pending Department Approval",
-                            "created_at": format_timestamp(latest_request["created_at"]) if latest_request else "Not available"
-                        }
-                    )
-                    st.success(f"Request submitted successfully! Email sent to {user_details['email']}.")
-                except Exception as e:
-                    st.warning(f"Request submitted successfully, but email failed: {e}")
-                
+                    subject = f"Request {req_id} Submitted"
+                    body = f"Your request has been successfully submitted and is pending department approval.\n\nDetails:\n{formatted_description}"
+                    try:
+                        with timer.stage("outbox"):
+                            queue_email(
+                                to_email=user_details["email"],
+                                admin_name="System",
+                                subject=subject,
+                                body=body,
+                                request_details={
+                                    "id": req_id,
+                                    "description": formatted_description,
+                                    "status": "Pending Department Approval",
+                                    "created_at": format_timestamp(latest_request["created_at"]) if latest_request else "Not available"
+                                }
+                            )
+                        st.success(f"Request submitted successfully! Email queued for {user_details['email']}.")
+                    except Exception as e:
+                        st.warning(f"Request submitted successfully, but email could not be queued: {e}")
+
+            if success:
                 st.session_state.selected_items = {}
                 st.session_state.request_submitted = True
                 st.rerun()
             else:
                 st.error(message)
-            
-            animation_placeholder.empty()
 
 def display_my_orders():
     st.subheader("My Orders")
@@ -376,10 +577,12 @@ def display_my_orders():
         st.error("Employee ID not found. Please log in again.")
         return
     
-    requests = get_requests_by_emp_id(emp_id) or []
+    requests = paginate_requests(
+        "my_orders",
+        lambda limit, before: get_requests_by_emp_id(emp_id, limit=limit, before=before)
+    )
     if requests:
-        sorted_requests = sorted(requests, key=lambda x: x.get("created_at", ""), reverse=True)
-        for req in sorted_requests:
+        for req in requests:
             req_id = req["id"]
             created_at = format_timestamp(req.get("created_at"))
             description = req["description"]
@@ -418,75 +621,133 @@ def user_dashboard():
     
     st.markdown('<div class="footer">Created by Digital Team</div>', unsafe_allow_html=True)
 
+def dept_request_card(req):
+    req_id = req["id"]
+    status = req["status"]
+    created_at = format_timestamp(req.get("created_at"))
+    updated_at = format_timestamp(req.get("updated_at", req.get("created_at")))
+    with st.expander(f"Request ID: {req_id} - {status}"):
+        st.write(f"**Employee ID:** {req['emp_id']}")
+        st.write(f"**Name:** {req['name']}")
+        st.write(f"**Email:** {req['email']}")
+        st.write(f"**Description:** {req['description']}")
+        st.write(f"**Status:** {status}")
+        st.write(f"**Created At:** {created_at}")
+        st.write(f"**Last Updated:** {updated_at}")
+        if status == "Pending Department Approval":
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("Approve", key=f"dept_approve_{req_id}", on_click=run_card_action,
+                          args=(req_id, "Approving request", _dept_review, req, "Department Approved"))
+            with col2:
+                st.button("Reject", key=f"dept_reject_{req_id}", on_click=run_card_action,
+                          args=(req_id, "Rejecting request", _dept_review, req, "Department Rejected"))
+
+def _dept_review(timer, req, status):
+    req_id = req["id"]
+    verb = "Approved" if status == "Department Approved" else "Rejected"
+    with timer.stage("database"):
+        success, _ = update_request_status(req_id, status)
+    if not success:
+        return "error", f"Failed to {verb[:-1].lower()} request {req_id}"
+    try:
+        with timer.stage("outbox"):
+            queue_email(
+                to_email=req["email"],
+                admin_name=f"{st.session_state.dept_head_department} Head",
+                subject=f"Request {req_id} {verb} by Department",
+                body=f"Your request has been {verb.lower()} by the department head.",
+                request_details=req
+            )
+        return "success", f"{verb} request {req_id} and email queued for {req['email']}"
+    except Exception as e:
+        return "warning", f"{verb} request {req_id}, but email could not be queued: {e}"
+
 def dept_head_dashboard():
     display_header({'department': st.session_state.dept_head_department})
     
     st.title(f"{st.session_state.dept_head_department} Department Dashboard")
-    requests = get_requests_by_department(st.session_state.dept_head_department) or []
+    st.subheader(f"All Requests for {st.session_state.dept_head_department}")
+    request_summary(REQUEST_STATUSES, st.session_state.dept_head_department)
+    requests = paginate_requests(
+        "dept_requests",
+        lambda limit, before: get_requests_by_department(st.session_state.dept_head_department, limit=limit, before=before)
+    )
     if requests:
-        st.subheader(f"All Requests for {st.session_state.dept_head_department}")
-        for req in requests:
-            req_id = req["id"]
-            emp_id = req["emp_id"]
-            name = req["name"]
-            email = req["email"]
-            description = req["description"]
-            status = req["status"]
-            created_at = format_timestamp(req.get("created_at"))
-            updated_at = format_timestamp(req.get("updated_at", req.get("created_at")))
-            with st.expander(f"Request ID: {req_id} - {status}"):
-                st.write(f"**Employee ID:** {emp_id}")
-                st.write(f"**Name:** {name}")
-                st.write(f"**Email:** {email}")
-                st.write(f"**Description:** {description}")
-                st.write(f"**Status:** {status}")
-                st.write(f"**Created At:** {created_at}")
-                st.write(f"**Last Updated:** {updated_at}")
-                if status == "Pending Department Approval":
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("Approve", key=f"dept_approve_{req_id}"):
-                            success, _ = update_request_status(req_id, "Department Approved")
-                            if success:
-                                try:
-                                    send_email(
-                                        to_email=email,
-                                        admin_name=f"{st.session_state.dept_head_department} Head",
-                                        subject=f"Request {req_id} Approved by Department",
-                                        body="Your request has been approved by the department head.",
-                                        request_details=req
-                                    )
-                                    st.success(f"Approved request {req_id} and email sent to {email}")
-                                except Exception as e:
-                                    st.warning(f"Approved request {req_id}, but email failed: {e}")
-                                st.rerun()
-                            else:
-                                st.error(f"Failed to approve request {req_id}")
-                    with col2:
-                        if st.button("Reject", key=f"dept_reject_{req_id}"):
-                            success, _ = update_request_status(req_id, "Department Rejected")
-                            if success:
-                                try:
-                                    send_email(
-                                        to_email=email,
-                                        admin_name=f"{st.session_state.dept_head_department} Head",
-                                        subject=f"Request {req_id} Rejected by Department",
-                                        body="Your request has been rejected by the department head.",
-                                        request_details=req
-                                    )
-                                    st.success(f"Rejected request {req_id} and email sent to {email}")
-                                except Exception as e:
-                                    st.warning(f"Rejected request {req_id}, but email failed: {e}")
-                                st.rerun()
-                            else:
-                                st.error(f"Failed to reject request {req_id}")
+        render_request_cards(requests, dept_request_card)
     else:
         st.info(f"No requests found for {st.session_state.dept_head_department}.")
     
     st.markdown('<div class="footer">Created by Digital Team</div>', unsafe_allow_html=True)
 
+def admin_request_card(req):
+    req_id = req["id"]
+    status = req["status"]
+    updated_at = format_timestamp(req.get("updated_at", req.get("created_at")))
+    with st.expander(f"Request ID: {req_id} - {status}", expanded=False):
+        st.write(f"**Employee ID:** {req['emp_id']}")
+        st.write(f"**Name:** {req['name']}")
+        st.write(f"**Department:** {req['department']}")
+        st.write(f"**Email:** {req['email']}")
+        st.write(f"**Description:** {req['description']}")
+        st.write(f"**Suggestion:** {req['suggestion'] or 'None'}")
+        st.write(f"**Current Status:** {status}")
+        st.write(f"**Last Updated:** {updated_at}")
+
+        if status == "Department Approved":
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button(f"Approve ", key=f"admin_approve_{req_id}", on_click=run_card_action,
+                          args=(req_id, "Approving request", _admin_approve, req))
+            with col2:
+                st.button(f"Reject ", key=f"admin_reject_{req_id}", on_click=run_card_action,
+                          args=(req_id, "Rejecting request", _admin_reject, req))
+
+        st.button(f"Delete Request ", key=f"delete_{req_id}", on_click=run_card_action,
+                  args=(req_id, "Deleting request", _admin_delete, req_id))
+
+def _admin_approve(timer, req):
+    req_id = req["id"]
+    with timer.stage("database"):
+        success, message, _ = approve_request(req_id)
+    if not success:
+        return "error", f"Failed to approve request {req_id}: {message}"
+    subject = "Request Approved by Admin"
+    body = f"Your request {req_id} has been approved by the admin. Item quantities have been updated."
+    try:
+        with timer.stage("outbox"):
+            queue_email(req["email"], "Admin", subject, body, request_details=req)
+        return "success", f"Updated request {req_id} to Admin Approved and reduced item quantities"
+    except Exception as e:
+        return "warning", f"Updated request {req_id} to Admin Approved, but email could not be queued: {e}"
+
+def _admin_reject(timer, req):
+    req_id = req["id"]
+    with timer.stage("database"):
+        success, message = update_request_status(req_id, "Admin Rejected")
+    if not success:
+        return "error", f"Failed to update request {req_id}: {message}"
+    subject = "Request Rejected by Admin"
+    body = f"Your request {req_id} has been rejected by the admin."
+    try:
+        with timer.stage("outbox"):
+            queue_email(req["email"], "Admin", subject, body, request_details=req)
+        return "success", f"Updated request {req_id} to Admin Rejected"
+    except Exception as e:
+        return "warning", f"Updated request {req_id} to Admin Rejected, but email could not be queued: {e}"
+
+def _admin_delete(timer, req_id):
+    try:
+        with timer.stage("database"):
+            success = delete_request(req_id)
+    except Exception as e:
+        return "error", f"Error deleting request {req_id}: {str(e)}. Please check database connection or constraints."
+    if success:
+        return "success", f"Deleted request {req_id}"
+    return "error", f"Failed to delete request {req_id}. Check server logs or database for details."
+
 def admin_dashboard():
-    display_header({'username': st.session_state.ADMIN_CREDENTIALS['username']})
+    display_header({'username': get_admin_credentials()['username']})
     
     st.title("Admin Dashboard")
 
@@ -500,116 +761,29 @@ def admin_dashboard():
     else:
         st.info("All items are sufficiently stocked.")
 
-    all_requests = get_all_requests()
-    requests = [req for req in all_requests if req["status"] not in ["Pending Department Approval"]]
+    post_review_statuses = [status for status in REQUEST_STATUSES if status != "Pending Department Approval"]
+    st.subheader("All Requests Post-Department Review")
+    request_summary(post_review_statuses)
+    requests = paginate_requests(
+        "admin_requests",
+        lambda limit, before: get_requests_by_status(post_review_statuses, limit=limit, before=before)
+    )
     if requests:
-        st.subheader("All Requests Post-Department Review")
-        for req in requests:
-            req_id = req["id"]
-            emp_id = req["emp_id"]
-            name = req["name"]
-            department = req["department"]
-            email = req["email"]
-            description = req["description"]
-            suggestion = req["suggestion"] or "None"
-            status = req["status"]
-            updated_at = format_timestamp(req.get("updated_at", req.get("created_at")))
-
-            with st.expander(f"Request ID: {req_id} - {status}", expanded=False):
-                st.write(f"**Employee ID:** {emp_id}")
-                st.write(f"**Name:** {name}")
-                st.write(f"**Department:** {department}")
-                st.write(f"**Email:** {email}")
-                st.write(f"**Description:** {description}")
-                st.write(f"**Suggestion:** {suggestion}")
-                st.write(f"**Current Status:** {status}")
-                st.write(f"**Last Updated:** {updated_at}")
-
-                animation_placeholder = st.empty()
-
-                if status == "Department Approved":
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button(f"Approve ", key=f"admin_approve_{req_id}"):
-                            show_loading_animation(animation_placeholder, "Approving request...")
-                            success, message = update_request_status(req_id, "Admin Approved")
-                            if success:
-                                request_items = get_request_items(req_id)
-                                items_updated = True
-                                for item in request_items:
-                                    item_id = item["item_id"]
-                                    requested_qty = item["quantity"]
-                                    current_items = get_all_items()
-                                    current_item = next((i for i in current_items if i["id"] == item_id), None)
-                                    if current_item:
-                                        new_quantity = max(0, current_item["quantity"] - requested_qty)
-                                        if not update_item_quantity(item_id, new_quantity):
-                                            items_updated = False
-                                            st.error(f"Failed to update quantity for item ID {item_id}")
-                                            break
-                                    else:
-                                        items_updated = False
-                                        st.error(f"Item ID {item_id} not found in inventory")
-                                        break
-
-                                if items_updated:
-                                    subject = "Request Approved by Admin"
-                                    body = f"Your request {req_id} has been approved by the admin. Item quantities have been updated."
-                                    try:
-                                        send_email(email, "Admin", subject, body, request_details=req)
-                                        st.success(f"Updated request {req_id} to Admin Approved and reduced item quantities")
-                                    except Exception as e:
-                                        st.warning(f"Updated request {req_id} to Admin Approved, but email failed: {e}")
-                                else:
-                                    st.warning(f"Updated request {req_id} to Admin Approved, but item quantities update failed")
-                            else:
-                                st.error(f"Failed to update request {req_id}: {message}")
-                            animation_placeholder.empty()
-                            st.rerun()
-                    with col2:
-                        if st.button(f"Reject ", key=f"admin_reject_{req_id}"):
-                            show_loading_animation(animation_placeholder, "Rejecting request...")
-                            success, message = update_request_status(req_id, "Admin Rejected")
-                            animation_placeholder.empty()
-                            if success:
-                                subject = "Request Rejected by Admin"
-                                body = f"Your request {req_id} has been rejected by the admin."
-                                try:
-                                    send_email(email, "Admin", subject, body, request_details=req)
-                                    st.success(f"Updated request {req_id} to Admin Rejected")
-                                except Exception as e:
-                                    st.warning(f"Updated request {req_id} to Admin Rejected, but email failed: {e}")
-                            else:
-                                st.error(f"Failed to update request {req_id}: {message}")
-                            st.rerun()
-
-                if st.button(f"Delete Request ", key=f"delete_{req_id}"):
-                    show_loading_animation(animation_placeholder, "Deleting request...")
-                    try:
-                        success = delete_request(req_id)
-                        animation_placeholder.empty()
-                        if success:
-                            st.success(f"Deleted request {req_id}")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed to delete request {req_id}. Check server logs or database for details.")
-                    except Exception as e:
-                        animation_placeholder.empty()
-                        st.error(f"Error deleting request {req_id}: {str(e)}. Please check database connection or constraints.")
+        render_request_cards(requests, admin_request_card)
     else:
         st.info("No requests have reached Department Approved status yet.")
 
     with st.expander("Manage Item Availability", expanded=False):
         search_query = st.text_input("Search Items", key="admin_item_search")
         filtered_items = [item for item in items if search_query.lower() in item["particular"].lower()]
-        animation_placeholder = st.empty()
         for item in filtered_items:
             col1, col2 = st.columns([4, 1])
             with col1:
+                reserved = f", reserved: {item['reserved']}" if item["reserved"] else ""
                 if item["quantity"] <= 10:
-                    st.markdown(f"<span style='color:red'>{item['particular']}</span> (Qty: {item['quantity']})", unsafe_allow_html=True)
+                    st.markdown(f"<span style='color:red'>{item['particular']}</span> (Qty: {item['quantity']}{reserved})", unsafe_allow_html=True)
                 else:
-                    st.write(f"{item['particular']} (Qty: {item['quantity']})")
+                    st.write(f"{item['particular']} (Qty: {item['quantity']}{reserved})")
             with col2:
                 new_quantity = st.number_input(
                     f"Set Qty for {item['particular']}",
@@ -618,13 +792,13 @@ def admin_dashboard():
                     key=f"qty_{item['id']}"
                 )
                 if st.button(f"Update {item['particular']}", key=f"update_qty_{item['id']}"):
-                    show_loading_animation(animation_placeholder, f"Updating {item['particular']} quantity...")
-                    if update_item_quantity(item["id"], new_quantity):
-                        animation_placeholder.empty()
+                    with track_operation(f"Updating {item['particular']} quantity...") as timer:
+                        with timer.stage("database"):
+                            updated = update_item_quantity(item["id"], new_quantity)
+                    if updated:
                         st.success(f"Updated {item['particular']} quantity to {new_quantity}")
                         st.rerun()
                     else:
-                        animation_placeholder.empty()
                         st.error(f"Failed to update {item['particular']} quantity")
 
     st.subheader("Send Email to User")
@@ -639,30 +813,28 @@ def admin_dashboard():
         selected_email = users[selected_user][1]
         email_subject = st.text_input("Email Subject")
         email_body = st.text_area("Email Body")
-        animation_placeholder = st.empty()
         if st.button("Send Email"):
             if selected_email and email_subject and email_body:
-                show_loading_animation(animation_placeholder, "Sending email...")
                 try:
-                    send_email(
-                        to_email=selected_email,
-                        admin_name="Admin",
-                        subject=email_subject,
-                        body=email_body,
-                        request_details=None
-                    )
-                    animation_placeholder.empty()
-                    st.success(f"Email sent to {selected_email}")
+                    with track_operation("Queueing email...") as timer:
+                        with timer.stage("outbox"):
+                            queue_email(
+                                to_email=selected_email,
+                                admin_name="Admin",
+                                subject=email_subject,
+                                body=email_body,
+                                request_details=None
+                            )
+                    st.success(f"Email queued for {selected_email}")
                 except Exception as e:
-                    animation_placeholder.empty()
-                    st.error(f"Failed to send email: {e}")
+                    st.error(f"Failed to queue email: {e}")
             else:
                 st.warning("Please fill in all fields.")
     else:
         st.info("No users found.")
 
     st.subheader("Send Email to Department")
-    department_options = st.session_state.DEPARTMENTS
+    department_options = get_departments()
     selected_department = st.selectbox(
         "Select Department",
         options=department_options,
@@ -674,135 +846,137 @@ def admin_dashboard():
         "Send to all users who have made requests in this department",
         key="send_to_all_users"
     )
-    animation_placeholder = st.empty()
     if st.button("Send Department Email", key="send_dept_email_btn"):
         if not selected_department or not dept_email_subject or not dept_email_body:
             st.warning("Please fill in all fields.")
         else:
-            show_loading_animation(animation_placeholder, "Sending department email...")
-            if send_to_all_users:
-                requests = get_requests_by_department(selected_department)
-                if requests:
-                    emails = list(set(req["email"] for req in requests))
-                    for email in emails:
-                        try:
-                            send_email(
-                                to_email=email,
+            with track_operation("Sending department email...") as timer:
+                if send_to_all_users:
+                    with timer.stage("database"):
+                        emails = get_department_requester_emails(selected_department)
+                    if emails:
+                        progress_bar = st.progress(0.0, text=f"Sending to {len(emails)} users...")
+
+                        def report_progress(done, total):
+                            progress_bar.progress(done / total, text=f"Sent {done} of {total}")
+
+                        with timer.stage("email"):
+                            sent, failed = send_bulk_email(
+                                emails,
                                 admin_name="Admin",
                                 subject=dept_email_subject,
                                 body=dept_email_body,
-                                request_details=None
+                                progress=report_progress
                             )
-                            st.success(f"Email sent to {email}")
-                        except Exception as e:
-                            st.error(f"Failed to send email to {email}: {e}")
-                    animation_placeholder.empty()
-                    st.success(f"Emails sent to {len(emails)} users in {selected_department}")
-                else:
-                    animation_placeholder.empty()
-                    st.info(f"No requests found for {selected_department}")
-            else:
-                dept_heads = get_all_department_heads()
-                dept_email = dept_heads.get(selected_department, {}).get("email", "")
-                if dept_email:
-                    try:
-                        send_email(
-                            to_email=dept_email,
-                            admin_name="Admin",
-                            subject=dept_email_subject,
-                            body=dept_email_body,
-                            request_details=None
-                        )
-                        animation_placeholder.empty()
-                        st.success(f"Email sent to {dept_email}")
-                    except Exception as e:
-                        animation_placeholder.empty()
-                        st.error(f"Failed to send email to {dept_email}: {e}")
+                        progress_bar.empty()
+                        if sent:
+                            st.success(f"Emails sent to {len(sent)} of {len(emails)} users in {selected_department}")
+                        if failed:
+                            st.error(f"Failed to send to {len(failed)} users")
+                            st.dataframe(
+                                [{"Email": email, "Reason": reason} for email, reason in failed.items()],
+                                hide_index=True
+                            )
+                    else:
+                        st.info(f"No requests found for {selected_department}")
                 else:
-                    animation_placeholder.empty()
-                    st.error(f"No email defined for the head of {selected_department}")
+                    with timer.stage("database"):
+                        dept_heads = get_all_department_heads()
+                    dept_email = dept_heads.get(selected_department, {}).get("email", "")
+                    if dept_email:
+                        try:
+                            with timer.stage("outbox"):
+                                queue_email(
+                                    to_email=dept_email,
+                                    admin_name="Admin",
+                                    subject=dept_email_subject,
+                                    body=dept_email_body,
+                                    request_details=None
+                                )
+                            st.success(f"Email queued for {dept_email}")
+                        except Exception as e:
+                            st.error(f"Failed to queue email for {dept_email}: {e}")
+                    else:
+                        st.error(f"No email defined for the head of {selected_department}")
     
     st.markdown('<div class="footer">Created by Digital Team</div>', unsafe_allow_html=True)
 
+def store_request_card(req):
+    req_id = req["id"]
+    status = req["status"]
+    updated_at = format_timestamp(req.get("updated_at", req.get("created_at")))
+    with st.expander(f"Request ID: {req_id} - {status}"):
+        st.write(f"**Employee ID:** {req['emp_id']}")
+        st.write(f"**Name:** {req['name']}")
+        st.write(f"**Department:** {req['department']}")
+        st.write(f"**Email:** {req['email']}")
+        st.write(f"**Description:** {req['description']}")
+        st.write(f"**Current Status:** {status}")
+        st.write(f"**Last Updated:** {updated_at}")
+
+        if status == "Admin Approved":
+            st.button("Start Packing", key=f"start_packing_{req_id}", on_click=run_card_action,
+                      args=(req_id, "Starting packing", _store_advance, req_id, "Packing"))
+        elif status == "Packing":
+            st.button("Mark as Dispatched", key=f"dispatch_{req_id}", on_click=run_card_action,
+                      args=(req_id, "Marking as dispatched", _store_advance, req_id, "Dispatched"))
+        elif status == "Dispatched":
+            st.text_input(f"Enter receiver name for Request {req_id}", key=f"delivered_to_{req_id}")
+            st.button("Mark as Delivered", key=f"deliver_{req_id}", on_click=run_card_action,
+                      args=(req_id, "Marking as delivered", _store_deliver, req))
+        elif status == "Delivered":
+            delivered_to = req.get("delivered_to", "N/A")
+            st.write(f"**Delivered to:** {delivered_to}")
+
+def _store_advance(timer, req_id, status):
+    with timer.stage("database"):
+        success, _ = update_request_status(req_id, status)
+    if status == "Packing":
+        if success:
+            return "success", f"Started packing for request {req_id}"
+        return "error", f"Failed to start packing for request {req_id}"
+    if success:
+        return "success", f"Marked as dispatched for request {req_id}"
+    return "error", f"Failed to dispatch request {req_id}"
+
+def _store_deliver(timer, req):
+    req_id = req["id"]
+    delivered_to = st.session_state.get(f"delivered_to_{req_id}", "").strip()
+    if not delivered_to:
+        return "warning", "Enter the receiver's name"
+    with timer.stage("database"):
+        success, _ = update_request_status(req_id, "Delivered", delivered_to=delivered_to)
+    if not success:
+        return "error", f"Failed to deliver request {req_id}"
+    try:
+        current_time = datetime.datetime.now(pytz.timezone(DISPLAY_TIMEZONE)).strftime("%B %d, %Y %H:%M:%S")
+        with timer.stage("outbox"):
+            queue_email(
+                to_email=req["email"],
+                admin_name="Store Manager",
+                subject=f"Request {req_id} Delivered",
+                body=f"Your request has been delivered to {delivered_to}.",
+                request_details=req,
+                delivered_to=delivered_to,
+                delivery_time=current_time
+            )
+        return "success", f"Marked as delivered for request {req_id} to {delivered_to} and email queued"
+    except Exception as e:
+        return "warning", f"Marked as delivered for request {req_id}, but email could not be queued: {e}"
+
 def store_dashboard():
-    display_header({'username': st.session_state.STORE_CREDENTIALS['username']})
+    display_header({'username': get_store_credentials()['username']})
     
     st.title("Store Dashboard")
     valid_statuses = ["Admin Approved", "Packing", "Dispatched", "Delivered"]
-    approved_requests = [req for req in (get_all_requests() or []) if req["status"] in valid_statuses]
+    st.subheader("Requests Ready for Processing")
+    request_summary(valid_statuses)
+    approved_requests = paginate_requests(
+        "store_requests",
+        lambda limit, before: get_requests_by_status(valid_statuses, limit=limit, before=before)
+    )
     if approved_requests:
-        st.subheader("Requests Ready for Processing")
-        for req in approved_requests:
-            req_id = req["id"]
-            emp_id = req["emp_id"]
-            name = req["name"]
-            department = req["department"]
-            email = req["email"]
-            description = req["description"]
-            status = req["status"]
-            updated_at = format_timestamp(req.get("updated_at", req.get("created_at")))
-
-            with st.expander(f"Request ID: {req_id} - {status}"):
-                st.write(f"**Employee ID:** {emp_id}")
-                st.write(f"**Name:** {name}")
-                st.write(f"**Department:** {department}")
-                st.write(f"**Email:** {email}")
-                st.write(f"**Description:** {description}")
-                st.write(f"**Current Status:** {status}")
-                st.write(f"**Last Updated:** {updated_at}")
-
-                animation_placeholder = st.empty()
-
-                if status == "Admin Approved":
-                    if st.button("Start Packing", key=f"start_packing_{req_id}"):
-                        show_loading_animation(animation_placeholder, "Starting packing...")
-                        success, _ = update_request_status(req_id, "Packing")
-                        animation_placeholder.empty()
-                        if success:
-                            st.success(f"Started packing for request {req_id}")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed to start packing for request {req_id}")
-                elif status == "Packing":
-                    if st.button("Mark as Dispatched", key=f"dispatch_{req_id}"):
-                        show_loading_animation(animation_placeholder, "Marking as dispatched...")
-                        success, _ = update_request_status(req_id, "Dispatched")
-                        animation_placeholder.empty()
-                        if success:
-                            st.success(f"Marked as dispatched for request {req_id}")
-                            st.rerun()
-                        else:
-                            st.error(f"Failed to dispatch request {req_id}")
-                elif status == "Dispatched":
-                    delivered_to = st.text_input(f"Enter receiver name for Request {req_id}", key=f"delivered_to_{req_id}")
-                    if st.button("Mark as Delivered", key=f"deliver_{req_id}"):
-                        if delivered_to.strip():
-                            show_loading_animation(animation_placeholder, "Marking as delivered...")
-                            success, _ = update_request_status(req_id, "Delivered", delivered_to=delivered_to.strip())
-                            animation_placeholder.empty()
-                            if success:
-                                try:
-                                    current_time = datetime.datetime.now(pytz.timezone(DISPLAY_TIMEZONE)).strftime("%B %d, %Y %H:%M:%S")
-                                    send_email(
-                                        to_email=email,
-                                        admin_name="Store Manager",
-                                        subject=f"Request {req_id} Delivered",
-                                        body=f"Your request has been delivered to {delivered_to}.",
-                                        request_details=req,
-                                        delivered_to=delivered_to,
-                                        delivery_time=current_time
-                                    )
-                                    st.success(f"Marked as delivered for request {req_id} to {delivered_to} and email sent")
-                                except Exception as e:
-                                    st.warning(f"Marked as delivered for request {req_id}, but email failed: {e}")
-                                st.rerun()
-                            else:
-                                st.error(f"Failed to deliver request {req_id}")
-                        else:
-                            st.warning("Enter the receiver's name")
-                elif status == "Delivered":
-                    delivered_to = req.get("delivered_to", "N/A")
-                    st.write(f"**Delivered to:** {delivered_to}")
+        render_request_cards(approved_requests, store_request_card)
     else:
         st.info("No requests ready for processing.")
     
@@ -814,17 +988,20 @@ def super_admin_dashboard():
     st.title("Super Admin Dashboard")
     st.write(f"Welcome, Super Admin ({st.session_state.user_details['email']})!")
 
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10 = st.tabs([
         "Manage Users",
         "Manage Department Heads",
         "Manage Admin",
         "Manage Store",
         "Manage Inventory",
         "Manage Departments",
-        "Manage Department Head Emails"
+        "Manage Department Head Emails",
+        "Email Outbox",
+        "Consumption Analytics",
+        "Diagnostics"
     ])
 
-    with tab1:
+    with tab1, profiler.section("Manage Users"):
         st.subheader("Manage Users")
         users = get_all_users() or []
         if users:
@@ -856,19 +1033,18 @@ def super_admin_dashboard():
         else:
             st.info("No users found.")
 
-    with tab2:
+    with tab2, profiler.section("Manage Department Heads"):
         st.subheader("Manage Department Heads")
-        st.session_state.DEPARTMENT_HEADS = get_all_department_heads()
-        for dept in sorted(st.session_state.DEPARTMENT_HEADS.keys()):
+        dept_heads = get_all_department_heads()
+        for dept in sorted(dept_heads.keys()):
             with st.expander(f"Department: {dept}"):
-                st.write(f"Username: {st.session_state.DEPARTMENT_HEADS[dept]['username']}")
+                st.write(f"Username: {dept_heads[dept]['username']}")
                 new_dept_password = st.text_input(f"New Password for {dept}", type="password", key=f"dept_pw_{dept}")
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("Update Password", key=f"update_dept_pw_{dept}"):
                         if new_dept_password:
                             if update_department_head_password(dept, new_dept_password):
-                                st.session_state.DEPARTMENT_HEADS[dept]["password"] = new_dept_password
                                 st.success(f"Password updated for {dept}")
                             else:
                                 st.error(f"Failed to update password for {dept}")
@@ -877,44 +1053,38 @@ def super_admin_dashboard():
                 with col2:
                     if st.button("Delete Department", key=f"delete_dept_{dept}"):
                         if delete_department_head(dept):
-                            del st.session_state.DEPARTMENT_HEADS[dept]
-                            st.session_state.DEPARTMENTS.remove(dept)
                             st.success(f"Deleted department {dept}")
                             st.rerun()
                         else:
                             st.error(f"Failed to delete department {dept}")
 
-    with tab3:
+    with tab3, profiler.section("Manage Admin"):
         st.subheader("Manage Admin")
-        st.session_state.ADMIN_CREDENTIALS = get_admin_credentials()
-        st.write(f"Current Username: {st.session_state.ADMIN_CREDENTIALS['username']}")
+        st.write(f"Current Username: {get_admin_credentials()['username']}")
         new_admin_password = st.text_input("New Password for Admin", type="password", key="admin_new_pw")
         if st.button("Update Admin Password", key="update_admin_pw_btn"):
             if new_admin_password:
                 if update_admin_password(new_admin_password):
-                    st.session_state.ADMIN_CREDENTIALS["password"] = new_admin_password
                     st.success("Admin password updated successfully")
                 else:
                     st.error("Failed to update admin password")
             else:
                 st.warning("Enter a new password")
 
-    with tab4:
+    with tab4, profiler.section("Manage Store"):
         st.subheader("Manage Store")
-        st.session_state.STORE_CREDENTIALS = get_store_credentials()
-        st.write(f"Current Username: {st.session_state.STORE_CREDENTIALS['username']}")
+        st.write(f"Current Username: {get_store_credentials()['username']}")
         new_store_password = st.text_input("New Password for Store", type="password", key="store_new_pw")
         if st.button("Update Store Password", key="update_store_pw_btn"):
             if new_store_password:
                 if update_store_password(new_store_password):
-                    st.session_state.STORE_CREDENTIALS["password"] = new_store_password
                     st.success("Store password updated successfully")
                 else:
                     st.error("Failed to update store password")
             else:
                 st.warning("Enter a new password")
 
-    with tab5:
+    with tab5, profiler.section("Manage Inventory"):
         st.subheader("Manage Inventory")
         items = get_all_items() or []
         if items:
@@ -944,24 +1114,63 @@ def super_admin_dashboard():
         new_item_qty = st.number_input("Initial Quantity", min_value=0, value=0, key="new_item_qty")
         if st.button("Add Item", key="add_item_btn"):
             if new_item_name:
-                animation_placeholder = st.empty()
-                show_loading_animation(animation_placeholder, "Adding item...")
-                if add_item(new_item_name, new_item_qty):
-                    animation_placeholder.empty()
+                with track_operation("Adding item...") as timer:
+                    with timer.stage("database"):
+                        added = add_item(new_item_name, new_item_qty)
+                if added:
                     st.success(f"Item '{new_item_name}' added successfully")
                     st.session_state.pop("new_item_name", None)
                     st.session_state.pop("new_item_qty", None)
                     st.rerun()
                 else:
-                    animation_placeholder.empty()
                     st.error("Item already exists or failed to add")
             else:
                 st.error("Enter an item name")
 
-    with tab6:
+        st.subheader("Stock History")
+        names = {item["id"]: item["particular"] for item in items}
+        today = datetime.date.today()
+        col1, col2 = st.columns(2)
+        with col1:
+            period_start = st.date_input("From", value=today - datetime.timedelta(days=30), key="stock_history_from")
+        with col2:
+            period_end = st.date_input("To", value=today, key="stock_history_to")
+        if period_start > period_end:
+            st.error("'From' must not be after 'To'")
+        else:
+            # Dates are whole days: the period runs from the end of the day before 'From'
+            opening = get_stock_as_of(period_start - datetime.timedelta(days=1))
+            closing = get_stock_as_of(period_end)
+            consumption = get_item_consumption(period_start - datetime.timedelta(days=1), period_end)
+            history = [
+                {
+                    "Item": names.get(item_id, f"Item {item_id} (removed)"),
+                    "Opening": opening.get(item_id, 0),
+                    "Issued": consumption.get(item_id, 0),
+                    "Closing": closing.get(item_id, 0),
+                }
+                for item_id in sorted(set(opening) | set(closing))
+            ]
+            if history:
+                st.dataframe(history, hide_index=True)
+            else:
+                st.info("No stock movements recorded in this period.")
+        with st.expander("Recent Stock Movements", expanded=False):
+            movements = get_stock_movements(limit=50)
+            if movements:
+                st.dataframe([
+                    {"When": created_at, "Item": particular, "Kind": kind, "Quantity": quantity,
+                     "Request": request_id, "Note": note}
+                    for _, _, particular, kind, quantity, request_id, note, created_at in movements
+                ], hide_index=True)
+            else:
+                st.info("No stock movements recorded yet.")
+
+    with tab6, profiler.section("Manage Departments"):
         st.subheader("Manage Departments")
         st.write("Current Departments:")
-        for dept in sorted(st.session_state.DEPARTMENTS):
+        departments = get_departments()
+        for dept in sorted(departments):
             st.write(f"- {dept}")
 
         st.subheader("Add New Department")
@@ -971,17 +1180,13 @@ def super_admin_dashboard():
         new_dept_email = st.text_input("Department Head Email (optional)", key="new_dept_email")
         if st.button("Add Department", key="add_dept_btn"):
             if new_dept_name and new_dept_username and new_dept_password:
-                if new_dept_name not in st.session_state.DEPARTMENTS:
-                    animation_placeholder = st.empty()
-                    show_loading_animation(animation_placeholder, "Adding department...")
-                    if add_department_head(new_dept_name, new_dept_username, new_dept_password, new_dept_email):
-                        st.session_state.DEPARTMENTS.append(new_dept_name)
-                        st.session_state.DEPARTMENT_HEADS[new_dept_name] = {
-                            "username": new_dept_username,
-                            "password": new_dept_password,
-                            "email": new_dept_email
-                        }
-                        animation_placeholder.empty()
+                if new_dept_email and not validate_email(new_dept_email):
+                    st.error("Invalid email format")
+                elif new_dept_name not in departments:
+                    with track_operation("Adding department...") as timer:
+                        with timer.stage("database"):
+                            added = add_department_head(new_dept_name, new_dept_username, new_dept_password, new_dept_email)
+                    if added:
                         st.success(f"Department '{new_dept_name}' added successfully")
                         st.session_state.pop("new_dept_name", None)
                         st.session_state.pop("new_dept_username", None)
@@ -989,18 +1194,17 @@ def super_admin_dashboard():
                         st.session_state.pop("new_dept_email", None)
                         st.rerun()
                     else:
-                        animation_placeholder.empty()
                         st.error("Failed to add department (possibly duplicate in database)")
                 else:
                     st.error("Department already exists")
             else:
                 st.error("All fields except email are required")
 
-    with tab7:
+    with tab7, profiler.section("Manage Department Head Emails"):
         st.subheader("Manage Department Head Emails")
-        st.session_state.DEPARTMENT_HEADS = get_all_department_heads()
-        for dept in sorted(st.session_state.DEPARTMENTS):
-            current_email = st.session_state.DEPARTMENT_HEADS.get(dept, {}).get("email", "")
+        dept_heads = get_all_department_heads()
+        for dept in sorted(dept_heads):
+            current_email = dept_heads[dept].get("email", "")
             with st.expander(f"Department: {dept}"):
                 st.write(f"Current Email: {current_email if current_email else 'No email set'}")
                 new_email = st.text_input(
@@ -1011,38 +1215,225 @@ def super_admin_dashboard():
                 if st.button("Update Head Email", key=f"update_head_email_{dept}"):
                     if new_email == "" or validate_email(new_email):
                         if update_department_head_email(dept, new_email):
-                            st.session_state.DEPARTMENT_HEADS[dept]["email"] = new_email
                             st.success(f"Department head email updated for {dept}")
                         else:
                             st.error("Failed to update department head email")
                     else:
                         st.error("Invalid email format")
+
+    with tab8, profiler.section("Email Outbox"):
+        st.subheader("Email Outbox")
+        summary = get_outbox_summary()
+        cols = st.columns(len(OUTBOX_STATUSES))
+        for col, status in zip(cols, OUTBOX_STATUSES):
+            col.metric(status.capitalize(), summary.get(status, 0))
+        status_filter = st.selectbox(
+            "Show messages",
+            options=[None] + OUTBOX_STATUSES,
+            format_func=lambda status: "All" if status is None else status.capitalize(),
+            key="outbox_status_filter"
+        )
+        messages = get_outbox_messages(status_filter)
+        if messages:
+            st.dataframe(messages, hide_index=True)
+        else:
+            st.info("No messages.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Retry Failed Messages", key="outbox_retry_failed", disabled=not summary.get("failed")):
+                st.success(f"Re-queued {requeue_emails('failed')} failed messages")
+                st.rerun()
+        with col2:
+            if st.button("Refresh", key="outbox_refresh"):
+                st.rerun()
+
+        st.subheader("Department Head Digests")
+        pending_events = get_pending_notification_events()
+        st.caption(
+            f"Request updates are summarised in one email per department head every {DIGEST_WINDOW / 60:.0f} minutes."
+        )
+        st.metric("Updates waiting for the next digest", len(pending_events))
+        if st.button("Send Digests Now", key="send_digests_now", disabled=not pending_events):
+            with track_operation("Queueing digests...") as timer:
+                with timer.stage("outbox"):
+                    queued = send_department_digests()
+            st.success(f"Queued {queued} digest emails")
+
+    with tab9, profiler.section("Consumption Analytics"):
+        st.subheader("Consumption Analytics")
+        st.caption("Quantities of admin-approved requests, by the week or month they were submitted.")
+        col1, col2 = st.columns(2)
+        with col1:
+            period_label = st.selectbox("Period", options=list(PERIODS), key="analytics_period")
+        with col2:
+            department_filter = st.selectbox(
+                "Department",
+                options=[None] + get_departments(),
+                format_func=lambda dept: "All departments" if dept is None else dept,
+                key="analytics_department"
+            )
+        trends = consumption_trends(PERIODS[period_label])
+        if department_filter is not None:
+            trends = trends[trends["department"] == department_filter]
+        if trends.empty:
+            st.info("No approved requests yet.")
+        else:
+            st.markdown(f"**Items issued ({period_label.lower()})**")
+            st.line_chart(department_totals(trends))
+            st.markdown("**Most consumed items**")
+            st.dataframe(top_items(trends), hide_index=True)
+            st.markdown("**Item consumption by period**")
+            st.dataframe(
+                trends.pivot_table(index="item", columns="period", values="quantity",
+                                   aggfunc="sum", fill_value=0, observed=True)
+                .rename(columns=lambda period: period.strftime("%Y-%m-%d"))
+            )
+
+    with tab10, profiler.section("Diagnostics"):
+        st.subheader("Database Diagnostics")
+        stats = get_query_stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            enabled = st.toggle("Collect query statistics", value=stats["enabled"], key="query_stats_enabled")
+        with col2:
+            slow_ms = st.number_input("Slow query threshold (ms)", min_value=0.0, value=float(stats["slow_query_ms"]),
+                                      step=50.0, key="slow_query_ms")
+        if enabled != stats["enabled"] or slow_ms != stats["slow_query_ms"]:
+            configure_query_stats(enabled=enabled, slow_query_ms=slow_ms)
+            stats = get_query_stats()
+
+        functions = stats["functions"]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Database calls", sum(entry["calls"] for entry in functions.values()))
+        col2.metric("Errors", sum(entry["errors"] for entry in functions.values()))
+        col3.metric("Slow calls logged", len(stats["slow_queries"]))
+        st.caption(f"Since {stats['since']} (UTC). Histogram buckets (ms): "
+                   f"{', '.join(str(bound) for bound in stats['buckets_ms'])}, more.")
+        if functions:
+            st.dataframe(
+                [{"Function": name, "Calls": entry["calls"], "Errors": entry["errors"],
+                  "Total ms": entry["total_ms"], "Avg ms": entry["avg_ms"], "p95 ms": entry["p95_ms"],
+                  "Max ms": entry["max_ms"], "Rows": entry["rows"], "Changes": entry["changes"],
+                  "Latency": entry["histogram"]}
+                 for name, entry in functions.items()],
+                hide_index=True,
+                column_config={"Latency": st.column_config.BarChartColumn("Latency histogram", y_min=0)}
+            )
+        else:
+            st.info("No database calls recorded yet.")
+
+        st.markdown(f"**Slow calls (over {stats['slow_query_ms']:g} ms)**")
+        if stats["slow_queries"]:
+            st.dataframe(
+                [{"At": entry["at"], "Function": entry["function"], "ms": entry["ms"], "Rows": entry["rows"],
+                  "Error": entry["error"], "Arguments": ", ".join(f"{k}={v}" for k, v in entry["arguments"].items()),
+                  "SQL": "; ".join(entry["statements"])}
+                 for entry in stats["slow_queries"]],
+                hide_index=True
+            )
+        else:
+            st.info("No slow calls recorded.")
+
+        with st.expander("Connection pool", expanded=False):
+            st.json(get_pool_stats())
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Download JSON", dump_query_stats(), file_name="query_stats.json",
+                               mime="application/json", key="download_query_stats")
+        with col2:
+            if st.button("Reset Statistics", key="reset_query_stats"):
+                reset_query_stats()
+                st.rerun()
+
+        st.subheader("Rerun Profiling")
+        profiling_enabled = st.toggle("Profile every script run (all sessions)", value=profiler.enabled,
+                                      key="profiling_enabled")
+        if profiling_enabled != profiler.enabled:
+            profiler.enabled = profiling_enabled
+        st.caption("Records wall time per page section and per database, mail and rendering-helper call, "
+                   f"keeping cProfile data for the {profiler.keep_slowest} slowest runs.")
+        runs = profiler.recent_runs()
+        if runs:
+            st.dataframe(
+                [{"Run": run["run_id"], "At": run["started_at"], "Page": run["page"], "Total ms": run["total_ms"],
+                  "Outcome": run["outcome"],
+                  "Slowest call": f"{run['calls'][0]['name']} ({run['calls'][0]['ms']:.0f} ms)" if run["calls"] else ""}
+                 for run in runs],
+                hide_index=True
+            )
+            selected_run = st.selectbox(
+                "Inspect run",
+                options=runs,
+                format_func=lambda run: f"#{run['run_id']} {run['page']} ({run['total_ms']:.0f} ms)",
+                key="profiling_run"
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Sections**")
+                st.dataframe(selected_run["sections"], hide_index=True)
+            with col2:
+                st.markdown("**Calls**")
+                st.dataframe(selected_run["calls"], hide_index=True)
+        else:
+            st.info("No profiled runs yet. Turn profiling on and use the app.")
+
+        slowest = profiler.slowest_runs()
+        if slowest:
+            st.markdown("**Slowest runs (cProfile)**")
+            slow_run = st.selectbox(
+                "Profile",
+                options=slowest,
+                format_func=lambda run: f"#{run['run_id']} {run['page']} ({run['total_ms']:.0f} ms)",
+                key="profiling_slow_run"
+            )
+            stats_text = profiler.format_pstats(slow_run["run_id"])
+            pstats_data = profiler.export_pstats(slow_run["run_id"])
+            if stats_text is not None and pstats_data is not None:
+                with st.expander("Top functions by cumulative time", expanded=False):
+                    st.code(stats_text, language=None)
+                st.download_button("Download .prof (pstats)", pstats_data,
+                                   file_name=f"rerun-{slow_run['run_id']}.prof",
+                                   mime="application/octet-stream", key="download_pstats")
+        if st.button("Clear Profiles", key="clear_profiles", disabled=not runs):
+            profiler.clear()
+            st.rerun()
     
     st.markdown('<div class="footer">Created by Digital Team</div>', unsafe_allow_html=True)
 
 def main():
-    load_css("styles.css")
-    st.markdown(
-        """
-        <img src="https://www.itvoice.in/wp-content/uploads/2023/01/CEAT-Tyre-logo-2000x1000-1.png" class="logo">
-        """,
-        unsafe_allow_html=True
-    )
+    with profiler.run(st.session_state.page):
+        with profiler.section("css"):
+            load_css("styles.css")
+        with profiler.section("logo"):
+            st.markdown(
+                """
+                <img src="https://www.itvoice.in/wp-content/uploads/2023/01/CEAT-Tyre-logo-2000x1000-1.png" class="logo">
+                """,
+                unsafe_allow_html=True
+            )
 
-    if st.session_state.page == "login":
-        login()
-    elif st.session_state.page == "register":
-        register()
-    elif st.session_state.page == "super_admin_dashboard":
-        super_admin_dashboard()
-    elif st.session_state.page == "user_dashboard":
-        user_dashboard()
-    elif st.session_state.page == "dept_head_dashboard":
-        dept_head_dashboard()
-    elif st.session_state.page == "admin_dashboard":
-        admin_dashboard()
-    elif st.session_state.page == "store_dashboard":
-        store_dashboard()
+        with profiler.section(st.session_state.page):
+            if st.session_state.page == "login":
+                login()
+            elif st.session_state.page == "register":
+                register()
+            elif st.session_state.page == "super_admin_dashboard":
+                super_admin_dashboard()
+            elif st.session_state.page == "user_dashboard":
+                user_dashboard()
+            elif st.session_state.page == "dept_head_dashboard":
+                dept_head_dashboard()
+            elif st.session_state.page == "admin_dashboard":
+                admin_dashboard()
+            elif st.session_state.page == "store_dashboard":
+                store_dashboard()
+
+# While profiling, calls into the data and mail layers and the shared
+# rendering helpers are timed per rerun; otherwise the wrappers pass through
+profiler.wrap_namespace(globals(), modules=("database", "mail", "analytics"), names=(
+    "load_css", "format_timestamp", "paginate_requests", "display_header", "user_request_form",
+    "display_my_orders", "validate_email",
+))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,921 @@
+"""
+Benchmarks for the inventory system.
+
+Every benchmark runs against a scratch database in a temporary directory, so
+the real requests.db is never touched.
+
+Usage:
+    python benchmark.py storage [--duration 3] [--levels 2x1,8x2,16x4,32x8]
+    python benchmark.py query-plans
+    python benchmark.py smtp [--messages 500]
+    python benchmark.py templates [--messages 5000]
+    python benchmark.py digest [--seed 2000]
+    python benchmark.py login [--users 10000]
+    python benchmark.py cold-start [--runs 5]
+    python benchmark.py analytics [--requests 100000]
+    python benchmark.py load [--users 500] [--departments 10] [--items 200] [--requests 20000]
+                             [--iterations 200] [--save results.json] [--baseline results.json]
+    python benchmark.py dashboards [--requests 2000] [--runs 5] [--threshold-scale 1.0]
+
+The smtp benchmark uses aiosmtpd as the stand-in server when it is installed
+and falls back to a minimal in-process SMTP sink otherwise.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import shutil
+import socketserver
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Point database.py at a scratch file before it is imported
+_SCRATCH_DIR = tempfile.mkdtemp(prefix="inventory-bench-")
+os.environ["INVENTORY_DB_PATH"] = os.path.join(_SCRATCH_DIR, "import.db")
+
+import analytics  # noqa: E402
+import database  # noqa: E402
+import mail  # noqa: E402
+
+DEPARTMENTS = ["FJS", "MIXTURE", "TBR STOCK", "PCR STOCK", "HR", "PROJECT", "PURCHASE", "STORE", "FINANCE", "IT"]
+
+# Storage settings init_db() used before WAL tuning (SQLite/Python defaults)
+BASELINE_STORAGE_SETTINGS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+    "busy_timeout": 5000,
+    "mmap_size": 0,
+    "cache_size": -2000,
+    "wal_autocheckpoint": 1000,
+}
+TUNED_STORAGE_SETTINGS = dict(database.STORAGE_SETTINGS)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def percentile(samples, pct):
+    """Returns the pct-th percentile of samples (nearest-rank)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def scratch_database(name, storage_settings=None, pool_size=None):
+    """Points database.py at a fresh database file and initialises its schema.
+
+    Args:
+        name (str): File name inside the scratch directory.
+        storage_settings (dict, optional): Overrides for database.STORAGE_SETTINGS.
+        pool_size (int, optional): Connection pool size.
+
+    Returns:
+        str: Path of the scratch database.
+    """
+    path = os.path.join(_SCRATCH_DIR, name)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    if storage_settings:
+        database.STORAGE_SETTINGS.update(storage_settings)
+    database.configure_pool(database=path, size=pool_size)
+    database.init_db()
+    return path
+
+
+def seed_requests(count, items_per_request=3):
+    """Inserts count requests from random users and departments."""
+    items = database.get_all_items()
+    # Enough stock that reservations never reject a seeded request
+    for item in items:
+        database.update_item_quantity(item["id"], 1_000_000)
+    for n in range(count):
+        chosen = random.sample(items, items_per_request)
+        database.insert_request(
+            f"User {n}",
+            f"user{n % 500}@ceat.com",
+            f"E{n % 500:05d}",
+            random.choice(DEPARTMENTS),
+            [{"item_id": item["id"], "quantity": 1} for item in chosen],
+            ", ".join(f"{item['particular']} (Qty: 1)" for item in chosen),
+            None,
+        )
+
+
+def _run_mixed_load(readers, writers, duration, request_ids):
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {"reads": 0, "writes": 0, "errors": 0, "read_ms": [], "write_ms": []}
+
+    def reader():
+        reads, errors, latencies = 0, 0, []
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                database.get_requests_by_department(random.choice(DEPARTMENTS))
+                database.get_all_items()
+                reads += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+            except sqlite3.OperationalError:
+                errors += 1
+        with lock:
+            results["reads"] += reads
+            results["errors"] += errors
+            results["read_ms"].extend(latencies)
+
+    def writer():
+        writes, errors, latencies = 0, 0, []
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                success, _ = database.update_request_status(random.choice(request_ids), "Department Approved")
+            except sqlite3.OperationalError:
+                success = False
+            if success:
+                writes += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+        with lock:
+            results["writes"] += writes
+            results["errors"] += errors
+            results["write_ms"].extend(latencies)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def benchmark_storage(levels, duration, seed_count):
+    """Compares concurrent reader/writer throughput before and after storage tuning."""
+    print(f"Mixed read/write load, {duration:.0f}s per level, {seed_count} seeded requests")
+    print(f"{'profile':<9} {'readers':>7} {'writers':>7} {'reads/s':>9} {'writes/s':>9} "
+          f"{'p95 read ms':>11} {'p95 write ms':>12} {'errors':>7}")
+    sustained = {}
+    for profile, settings in (("baseline", BASELINE_STORAGE_SETTINGS), ("tuned", TUNED_STORAGE_SETTINGS)):
+        for readers, writers in levels:
+            scratch_database(f"storage-{profile}.db", settings, pool_size=readers + writers)
+            seed_requests(seed_count)
+            with database.get_connection() as conn:
+                request_ids = [row[0] for row in conn.execute("SELECT id FROM request")]
+            results = _run_mixed_load(readers, writers, duration, request_ids)
+            print(f"{profile:<9} {readers:>7} {writers:>7} {results['reads'] / duration:>9.0f} "
+                  f"{results['writes'] / duration:>9.0f} {percentile(results['read_ms'], 95):>11.1f} "
+                  f"{percentile(results['write_ms'], 95):>12.1f} {results['errors']:>7}")
+            if results["errors"] == 0:
+                sustained[profile] = (readers, writers)
+    for profile in ("baseline", "tuned"):
+        if profile in sustained:
+            readers, writers = sustained[profile]
+            print(f"{profile}: sustained {readers} readers + {writers} writers without lock errors")
+        else:
+            print(f"{profile}: lock errors at every level")
+    database.STORAGE_SETTINGS.update(TUNED_STORAGE_SETTINGS)
+
+
+# (function, args) pairs whose SELECTs must be answered from an index
+PAGE_CURSOR = ("2099-01-01 00:00:00", 1 << 40)
+QUERY_PLAN_CHECKS = [
+    ("login_user", ("user1@ceat.com", "secret")),
+    ("authenticate_principal", ("user1@ceat.com", "secret")),
+    ("get_requests_by_emp_id", ("E00001",)),
+    ("get_requests_by_emp_id", ("E00001", 20, PAGE_CURSOR)),
+    ("get_requests_by_department", ("HR",)),
+    ("get_requests_by_department", ("HR", 20, PAGE_CURSOR)),
+    ("get_department_requester_emails", ("HR",)),
+    ("get_requests_by_status", (["Admin Approved", "Packing", "Dispatched", "Delivered"], 20)),
+    ("get_requests_by_status", (["Admin Approved", "Packing", "Dispatched", "Delivered"], 20, PAGE_CURSOR)),
+    ("get_request_items", (1,)),
+    ("get_available_quantity", (1,)),
+]
+# get_all_requests() deliberately reads the whole table
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def capture_statements(function, *args):
+    """Calls a database.py function and returns the SQL statements it executed."""
+    statements = []
+    with database.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            function(*args)
+        finally:
+            conn.set_trace_callback(None)
+    return statements
+
+
+def check_query_plans(seed_count):
+    """Runs EXPLAIN QUERY PLAN on every statement issued by the checked query functions.
+
+    Returns:
+        bool: True if no checked statement scans a whole table.
+    """
+    scratch_database("query-plans.db")
+    seed_requests(seed_count)
+    with database.get_connection() as conn:
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    ok = True
+    for name, args in QUERY_PLAN_CHECKS:
+        for statement in capture_statements(getattr(database, name), *args):
+            if not statement.lstrip().upper().startswith("SELECT"):
+                continue
+            with database.get_connection() as conn:
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+            # Scanning a view's co-routine (e.g. principals) reads only the rows its branches found
+            scans = [detail for detail in plan
+                     if FULL_SCAN.match(detail) and f"CO-ROUTINE {FULL_SCAN.match(detail).group(1)}" not in plan]
+            status = "FULL SCAN" if scans else "ok"
+            ok = ok and not scans
+            print(f"{name:<32} {status:<9} {' | '.join(plan)}")
+    return ok
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Accepts and discards every message, answering just enough SMTP for smtplib."""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self._reply("220 localhost benchmark sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self._reply("250 localhost")
+            elif command == b"DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self._reply("250 OK")
+            elif command == b"QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class _ThreadedSMTPSink(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_smtp_server():
+    """Starts a local stand-in SMTP server.
+
+    Returns:
+        tuple: (port, stop function, server name).
+    """
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.handlers import Sink
+    except ImportError:
+        server = _ThreadedSMTPSink(("127.0.0.1", 0), _SMTPSinkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+        return server.server_address[1], stop, "stdlib sink"
+    controller = Controller(Sink(), hostname="127.0.0.1", port=0)
+    controller.start()
+    return controller.port, controller.stop, "aiosmtpd"
+
+
+def benchmark_smtp(count):
+    """Compares a new SMTP connection per message with the reused mail.SMTPSession."""
+    port, stop, server_name = start_smtp_server()
+    message = (f"From: {mail.SMTP_FROM}\r\nTo: bench@example.com\r\nSubject: Benchmark\r\n\r\n"
+               + "Request update.\r\n" * 40)
+    print(f"{count} messages to a local {server_name} on port {port}")
+    print(f"{'mode':<22} {'msgs/s':>8} {'p95 ms':>8} {'connects':>9}")
+    try:
+        for mode, max_messages in (("connection per message", 1),
+                                   ("reused session", mail.SMTP_MAX_MESSAGES_PER_CONNECTION)):
+            session = mail.SMTPSession(host="127.0.0.1", port=port, use_tls=False, username="",
+                                       max_messages=max_messages)
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(count):
+                sent_at = time.perf_counter()
+                session.sendmail(mail.SMTP_FROM, "bench@example.com", message)
+                latencies.append((time.perf_counter() - sent_at) * 1000)
+            elapsed = time.perf_counter() - start
+            session.close()
+            print(f"{mode:<22} {count / elapsed:>8.0f} {percentile(latencies, 95):>8.2f} "
+                  f"{session.stats()['connects']:>9}")
+    finally:
+        stop()
+    print("The stand-in server has no STARTTLS or AUTH, so a real relay saves more per reused message.")
+
+
+def benchmark_templates(count):
+    """Reports the render time per message for every email template."""
+    scratch_database("templates.db")
+    seed_requests(1, items_per_request=5)
+    request = database.get_all_requests()[0]
+    items = database.get_request_item_details(request["id"])
+    cases = [
+        ("approved", "Request 1 Approved", {}, request),
+        ("rejected", "Request 1 Rejected", {}, request),
+        ("delivered", "Request 1 Delivered", {"delivered_to": "Store", "delivery_time": "now"}, request),
+        ("generic", "Request 1 Submitted", {}, request),
+        ("custom", "Notice", {}, None),
+        ("approved, items given", "Request 1 Approved", {}, dict(request, items=items)),
+    ]
+    print(f"{count} renders per template")
+    print(f"{'template':<22} {'us/msg':>8} {'p95 us':>8}")
+    for label, subject, extra, details in cases:
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            mail.render_email_html("Admin", subject, "Line one\nLine two", details, **extra)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        print(f"{label:<22} {sum(latencies) / count:>8.1f} {percentile(latencies, 95):>8.1f}")
+    print("Templates other than 'custom' and 'items given' include the request_items query.")
+
+
+def benchmark_digest(seed_count):
+    """Reports the digest messages one window queues and the request events they cover."""
+    scratch_database("digest.db")
+    for department in DEPARTMENTS:
+        database.add_department_head(department, department.lower(), "secret", f"{department.lower()}@ceat.com")
+    seed_requests(seed_count)
+    with database.get_connection() as conn:
+        request_ids = [row[0] for row in conn.execute("SELECT id FROM request")]
+    for request_id in random.sample(request_ids, len(request_ids) // 2):
+        database.update_request_status(request_id, random.choice(["Department Approved", "Department Rejected"]))
+
+    pending = database.get_pending_notification_events()
+    departments = len({event["department"] for event in pending})
+    start = time.perf_counter()
+    digests = mail.send_department_digests()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{len(pending)} request events in one window across {departments} departments")
+    print(f"digest messages queued: {digests} ({len(pending) / max(digests, 1):.0f} events per message), "
+          f"queued in {elapsed:.0f} ms")
+
+
+def _legacy_login(login, password):
+    # The role-by-role chain login() used before authenticate_principal()
+    admin = database.get_admin_credentials()
+    if login == admin["username"] and password == admin["password"]:
+        return "admin"
+    store = database.get_store_credentials()
+    if login == store["username"] and password == store["password"]:
+        return "store"
+    for department, creds in database.get_all_department_heads().items():
+        if creds["username"] == login and creds["password"] == password:
+            return "dept_head"
+    return "user" if database.login_user(login, password) else None
+
+
+def benchmark_login(user_count, attempts):
+    """Compares login latency of the role-by-role chain with the single principals query."""
+    scratch_database("login.db")
+    for department in DEPARTMENTS:
+        database.add_department_head(department, department.lower(), "secret", "")
+    with database.get_connection() as conn:
+        conn.executemany("INSERT INTO users (emp_id, email, password) VALUES (?, ?, ?)",
+                         [(f"E{n:05d}", f"user{n}@ceat.com", "secret") for n in range(user_count)])
+        conn.commit()
+    cases = [
+        ("admin", lambda: ("admin", "admin123")),
+        ("department head", lambda: (random.choice(DEPARTMENTS).lower(), "secret")),
+        ("user", lambda: (f"user{random.randrange(user_count)}@ceat.com", "secret")),
+        ("failed", lambda: (f"user{random.randrange(user_count)}@ceat.com", "wrong")),
+    ]
+    print(f"{user_count} users, {attempts} logins per case")
+    print(f"{'case':<16} {'chain p50 ms':>12} {'chain p95 ms':>12} {'query p50 ms':>12} {'query p95 ms':>12}")
+    for label, credentials in cases:
+        timings = {}
+        for name, login in (("chain", _legacy_login), ("query", database.authenticate_principal)):
+            latencies = []
+            for _ in range(attempts):
+                args = credentials()
+                start = time.perf_counter()
+                login(*args)
+                latencies.append((time.perf_counter() - start) * 1000)
+            timings[name] = latencies
+        print(f"{label:<16} {percentile(timings['chain'], 50):>12.3f} {percentile(timings['chain'], 95):>12.3f} "
+              f"{percentile(timings['query'], 50):>12.3f} {percentile(timings['query'], 95):>12.3f}")
+
+
+# Each snippet runs in a fresh interpreter and prints the milliseconds it measured
+COLD_START_STEPS = [
+    ("import database", None, """
+import time
+start = time.perf_counter()
+import database
+print((time.perf_counter() - start) * 1000)
+"""),
+    ("first query, new database", "fresh", """
+import time
+import database
+start = time.perf_counter()
+database.get_all_items()
+print((time.perf_counter() - start) * 1000)
+"""),
+    ("first query, current schema", "current", """
+import time
+import database
+start = time.perf_counter()
+database.get_all_items()
+print((time.perf_counter() - start) * 1000)
+"""),
+    ("streamlit login page, first run", "current", """
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file(APP_PATH, default_timeout=60)
+app.run()
+print((time.perf_counter() - start) * 1000)
+"""),
+]
+
+
+def benchmark_cold_start(runs):
+    """Times the start of a fresh process: importing database.py, its first query and a first app run."""
+    current = scratch_database("cold-start.db")
+    database.get_pool().close()
+    print(f"Median of {runs} fresh processes")
+    print(f"{'step':<34} {'median ms':>10} {'max ms':>8}")
+    for label, db_state, snippet in COLD_START_STEPS:
+        samples = []
+        for run in range(runs):
+            path = current
+            if db_state != "current":
+                path = os.path.join(_SCRATCH_DIR, f"cold-start-fresh-{run}.db")
+            env = dict(os.environ, INVENTORY_DB_PATH=path)
+            output = subprocess.run(
+                [sys.executable, "-c", snippet.replace("APP_PATH", repr(APP_PATH))],
+                cwd=os.path.dirname(APP_PATH), env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(float(output.strip().splitlines()[-1]))
+        print(f"{label:<34} {statistics.median(samples):>10.1f} {max(samples):>8.1f}")
+
+
+def _parse_levels(value):
+    levels = []
+    for part in value.split(","):
+        readers, writers = part.lower().split("x")
+        levels.append((int(readers), int(writers)))
+    return levels
+
+
+def seed_request_history(count, items_per_request=3, days=365, departments=DEPARTMENTS, status_mix=None,
+                         users=500):
+    """Bulk-inserts count requests spread over the last days days, bypassing stock checks.
+
+    Args:
+        count (int): Requests to insert.
+        items_per_request (int): Line items per request.
+        days (int): Age of the oldest request.
+        departments (list): Departments to draw from.
+        status_mix (dict, optional): Relative weight of each status; uniform if omitted.
+        users (int): Distinct requesters (user0@ceat.com / E00000 onwards).
+    """
+    items = database.get_all_items()
+    statuses = list(status_mix) if status_mix else database.REQUEST_STATUSES
+    weights = list(status_mix.values()) if status_mix else None
+    now = time.time()
+    requests, lines = [], []
+    for n, status in enumerate(random.choices(statuses, weights, k=count), start=1):
+        created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - random.random() * days * 86400))
+        requests.append((n, f"User {n}", f"user{n % users}@ceat.com", f"E{n % users:05d}", random.choice(departments),
+                         "", status, created_at, created_at))
+        lines.extend((n, item["id"], random.randint(1, 10)) for item in random.sample(items, items_per_request))
+    with database.get_connection() as conn:
+        conn.executemany("""
+            INSERT INTO request (id, name, email, emp_id, department, description, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, requests)
+        conn.executemany("INSERT INTO request_items (request_id, item_id, quantity) VALUES (?, ?, ?)", lines)
+        conn.commit()
+    database.bump_data_version(database.REQUESTS)
+
+
+def _loop_trends(period):
+    """Per-row Python aggregation of the same data, for comparison with analytics.consumption_trends()."""
+    totals = {}
+    for created_at, department, _, item, quantity in database.get_consumption_records():
+        day = analytics.pd.Timestamp(created_at, tz="UTC").tz_convert(analytics.ANALYTICS_TIMEZONE).date()
+        if period == "M":
+            start = day.replace(day=1)
+        else:
+            start = day - datetime.timedelta(days=day.weekday())
+        key = (start, department, item)
+        totals[key] = totals.get(key, 0) + quantity
+    return totals
+
+
+def benchmark_analytics(request_count):
+    """Times the consumption analytics: first build, cached reads and a per-row Python loop."""
+    scratch_database("analytics.db")
+    seed_request_history(request_count)
+    print(f"{request_count} requests, {len(database.get_consumption_records())} issued request lines")
+    print(f"{'step':<40} {'ms':>9}")
+
+    def timed(label, function):
+        start = time.perf_counter()
+        result = function()
+        print(f"{label:<40} {(time.perf_counter() - start) * 1000:>9.1f}")
+        return result
+
+    timed("bulk query only", database.get_consumption_records)
+    timed("load + weekly trends (cold)", lambda: analytics.consumption_trends("W"))
+    timed("monthly trends (frame cached)", lambda: analytics.consumption_trends("M"))
+    trends = timed("weekly trends (cached)", lambda: analytics.consumption_trends("W"))
+    timed("department totals + top items", lambda: (analytics.department_totals(trends), analytics.top_items(trends)))
+    timed("weekly trends, per-row Python loop", lambda: _loop_trends("W"))
+
+
+# Share of seeded requests in each status, roughly what a live system accumulates
+STATUS_MIX = {
+    "Pending Department Approval": 8,
+    "Department Approved": 4,
+    "Department Rejected": 5,
+    "Admin Approved": 3,
+    "Admin Rejected": 3,
+    "Packing": 2,
+    "Dispatched": 5,
+    "Delivered": 70,
+}
+LOAD_STOCK = 10 ** 9  # Stock per item, so reservations and approvals never run short
+
+
+def seed_load_dataset(users, departments, items, requests):
+    """Fills the current scratch database with the given volumes.
+
+    Returns:
+        list: Department names.
+    """
+    names = (DEPARTMENTS + [f"DEPT {n}" for n in range(len(DEPARTMENTS), departments)])[:departments]
+    for department in names:
+        database.add_department_head(department, department.lower().replace(" ", "_"), "secret", "")
+    with database.get_connection() as conn:
+        conn.executemany("INSERT INTO users (emp_id, email, password) VALUES (?, ?, ?)",
+                         [(f"E{n:05d}", f"user{n}@ceat.com", "secret") for n in range(users)])
+        existing = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        conn.executemany("INSERT INTO items (particular, quantity) VALUES (?, ?)",
+                         [(f"LOAD ITEM {n}", LOAD_STOCK) for n in range(existing, items)])
+        conn.execute("UPDATE items SET quantity = ?", (LOAD_STOCK,))
+        conn.commit()
+    database.bump_data_version(database.CATALOGUE)
+    seed_request_history(requests, departments=names, status_mix=STATUS_MIX, users=users)
+    with database.get_connection() as conn:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return names
+
+
+def _pending_request_ids():
+    with database.get_connection() as conn:
+        rows = conn.execute("SELECT id FROM request WHERE status = 'Pending Department Approval'").fetchall()
+    ids = [row[0] for row in rows]
+    random.shuffle(ids)
+    return ids
+
+
+def run_load_operations(departments, users, iterations):
+    """Times each database operation and returns {operation: [latency ms, ...]}."""
+    items = database.get_all_items()
+    pending = _pending_request_ids()
+
+    def insert():
+        n = random.randrange(users)
+        chosen = random.sample(items, 3)
+        database.insert_request(
+            f"User {n}", f"user{n}@ceat.com", f"E{n:05d}", random.choice(departments),
+            [{"item_id": item["id"], "quantity": 1} for item in chosen],
+            ", ".join(f"{item['particular']} (Qty: 1)" for item in chosen), None,
+        )
+
+    def status_update():
+        database.update_request_status(pending.pop(), "Department Rejected")
+
+    def approval():
+        request_id = pending.pop()
+        database.update_request_status(request_id, "Department Approved")
+        database.approve_request(request_id)
+
+    # (operation, callable, calls); whole-table reads run a tenth as often
+    operations = [
+        ("insert_request", insert, iterations),
+        ("get_requests_by_department", lambda: database.get_requests_by_department(random.choice(departments)),
+         iterations),
+        ("get_requests_by_department (page)",
+         lambda: database.get_requests_by_department(random.choice(departments), 20), iterations),
+        ("get_all_requests", database.get_all_requests, max(iterations // 10, 5)),
+        ("update_request_status", status_update, iterations),
+        ("approval flow", approval, iterations),
+    ]
+    # Each status update and approval consumes one pending request
+    if len(pending) < 2 * iterations:
+        raise SystemExit(f"Only {len(pending)} pending requests; seed more requests or lower --iterations")
+    results = {}
+    for name, operation, calls in operations:
+        latencies = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            operation()
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = latencies
+    return results
+
+
+def summarize_latencies(latencies):
+    """Returns calls, p50/p95/p99/max latency in ms and throughput in operations per second."""
+    return {
+        "calls": len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+        "ops_per_s": len(latencies) / (sum(latencies) / 1000) if sum(latencies) else 0.0,
+    }
+
+
+def benchmark_load(users, departments, items, requests, iterations, save=None, baseline=None, tolerance=1.5):
+    """Seeds a scratch database and reports latency percentiles and throughput per database operation.
+
+    Args:
+        save (str, optional): Write the summary to this JSON file.
+        baseline (str, optional): Compare p95 latencies with a summary saved earlier.
+        tolerance (float): Allowed p95 ratio against the baseline before an operation counts as a regression.
+
+    Returns:
+        bool: False if any operation regressed against the baseline.
+    """
+    scratch_database("load.db")
+    start = time.perf_counter()
+    names = seed_load_dataset(users, departments, items, requests)
+    print(f"Seeded {users} users, {len(names)} departments, {items} items, {requests} requests "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    summary = {name: summarize_latencies(latencies)
+               for name, latencies in run_load_operations(names, users, iterations).items()}
+    print(f"{'operation':<36} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'ops/s':>9}")
+    for name, stats in summary.items():
+        print(f"{name:<36} {stats['calls']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f} {stats['ops_per_s']:>9.0f}")
+
+    if save:
+        with open(save, "w") as f:
+            json.dump({"volumes": {"users": users, "departments": len(names), "items": items, "requests": requests},
+                       "operations": summary}, f, indent=2)
+        print(f"Saved results to {save}")
+
+    ok = True
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)["operations"]
+        for name, stats in summary.items():
+            if name not in previous or not previous[name]["p95_ms"]:
+                continue
+            ratio = stats["p95_ms"] / previous[name]["p95_ms"]
+            if ratio > tolerance:
+                ok = False
+                print(f"REGRESSION {name}: p95 {stats['p95_ms']:.2f} ms vs {previous[name]['p95_ms']:.2f} ms "
+                      f"({ratio:.1f}x, tolerance {tolerance}x)")
+        if ok:
+            print(f"No operation's p95 grew more than {tolerance}x against {baseline}")
+    return ok
+
+
+# Threads app.py starts that poll the database on their own schedule
+BACKGROUND_THREADS = ("email-outbox-worker", "email-digest-scheduler", "storage-maintenance")
+WIDGET_TYPES = {"button", "checkbox", "date_input", "download_button", "multiselect", "number_input", "radio",
+                "selectbox", "slider", "text_area", "text_input", "time_input", "toggle"}
+
+# Per-dashboard ceilings for one rerun against the default seed: twice the slowest
+# measured rerun and twice the measured elements and database calls, with floors of
+# 500 ms and 5 calls so timer noise on the small dashboards does not fail the run.
+# On much slower hardware, scale them with --threshold-scale.
+#
+# Measured (benchmark.py dashboards --runs 3, 2000 seeded requests):
+#   dashboard        median ms  max ms  elements  db calls
+#   login                   96     102        13         0
+#   user                   114     115        61         1
+#   department head        143     216       219         2
+#   admin                  639     900      1476         3
+#   store                  165     233       231         2
+#   super admin          10022   13900      5149         8
+DASHBOARD_THRESHOLDS = {
+    "login": {"run_ms": 500, "elements": 30, "db_calls": 5},
+    "user": {"run_ms": 500, "elements": 125, "db_calls": 5},
+    "department head": {"run_ms": 500, "elements": 440, "db_calls": 5},
+    "admin": {"run_ms": 1800, "elements": 2950, "db_calls": 6},
+    "store": {"run_ms": 500, "elements": 465, "db_calls": 5},
+    "super admin": {"run_ms": 27800, "elements": 10300, "db_calls": 16},
+}
+
+
+@contextmanager
+def counting_database_calls():
+    """Counts database.get_connection() checkouts made outside the background email threads.
+
+    Yields:
+        dict: {"calls": n}, updated while the block runs.
+    """
+    counter = {"calls": 0}
+    lock = threading.Lock()
+    original = database.get_connection
+
+    @contextmanager
+    def counted_connection():
+        if threading.current_thread().name not in BACKGROUND_THREADS:
+            with lock:
+                counter["calls"] += 1
+        with original() as conn:
+            yield conn
+
+    database.get_connection = counted_connection
+    try:
+        yield counter
+    finally:
+        database.get_connection = original
+
+
+def count_elements(node, counts=None):
+    """Counts the nodes of an AppTest element tree by type (blocks such as expanders included)."""
+    counts = {} if counts is None else counts
+    counts[node.type] = counts.get(node.type, 0) + 1
+    for child in (getattr(node, "children", None) or {}).values():
+        count_elements(child, counts)
+    return counts
+
+
+def _super_admin_credentials():
+    with open(APP_PATH) as f:
+        source = f.read()
+    return (re.search(r'^SUPER_ADMIN_EMAIL = "([^"]*)"', source, re.M).group(1),
+            re.search(r'^SUPER_ADMIN_PASSWORD = "([^"]*)"', source, re.M).group(1))
+
+
+def dashboard_logins(departments):
+    """Returns (role, login, password, expected page) for every role, using seeded accounts."""
+    admin = database.get_admin_credentials()
+    store = database.get_store_credentials()
+    head = database.get_all_department_heads()[departments[0]]
+    return [
+        ("login", None, None, "login"),
+        ("user", "user1@ceat.com", "secret", "user_dashboard"),
+        ("department head", head["username"], head["password"], "dept_head_dashboard"),
+        ("admin", admin["username"], admin["password"], "admin_dashboard"),
+        ("store", store["username"], store["password"], "store_dashboard"),
+        ("super admin", *_super_admin_credentials(), "super_admin_dashboard"),
+    ]
+
+
+def benchmark_dashboards(request_count, runs, threshold_scale=1.0):
+    """Logs in as each role with AppTest and measures a dashboard rerun: time, elements and database calls.
+
+    Returns:
+        bool: False if any dashboard exceeded its DASHBOARD_THRESHOLDS entry (scaled by threshold_scale).
+    """
+    from streamlit.testing.v1 import AppTest
+
+    scratch_database("dashboards.db")
+    departments = seed_load_dataset(users=500, departments=len(DEPARTMENTS), items=200, requests=request_count)
+    print(f"Seeded {request_count} requests; median of {runs} reruns per dashboard after logging in")
+    print(f"{'dashboard':<16} {'run ms':>8} {'max ms':>8} {'elements':>9} {'widgets':>8} {'expanders':>10} "
+          f"{'db calls':>9}  result")
+    ok = True
+    for role, login, password, page in dashboard_logins(departments):
+        app = AppTest.from_file(APP_PATH, default_timeout=120)
+        app.run()
+        if login is not None:
+            app.text_input(key="login_email").input(login)
+            app.text_input(key="login_password").input(password)
+            app.button(key="login_submit_btn").click()
+            app.run()
+        if app.exception or app.session_state["page"] != page:
+            ok = False
+            print(f"{role:<16} login failed: {[e.value for e in app.exception] or app.session_state['page']}")
+            continue
+
+        timings, calls = [], []
+        for _ in range(runs):
+            with counting_database_calls() as counter:
+                start = time.perf_counter()
+                app.run()
+                timings.append((time.perf_counter() - start) * 1000)
+            calls.append(counter["calls"])
+        counts = count_elements(app._tree)
+        measured = {
+            "run_ms": statistics.median(timings),
+            "elements": sum(counts.values()) - counts.get("root", 0),
+            "db_calls": statistics.median(calls),
+        }
+        limits = DASHBOARD_THRESHOLDS[role]
+        exceeded = [f"{name} > {limit * threshold_scale:g}" for name, limit in limits.items()
+                    if measured[name] > limit * threshold_scale]
+        if app.exception:
+            exceeded.append(f"exception: {app.exception[0].value}")
+        ok = ok and not exceeded
+        print(f"{role:<16} {measured['run_ms']:>8.0f} {max(timings):>8.0f} {measured['elements']:>9} "
+              f"{sum(counts.get(kind, 0) for kind in WIDGET_TYPES):>8} {counts.get('expander', 0):>10} "
+              f"{measured['db_calls']:>9g}  {'FAIL ' + ', '.join(exceeded) if exceeded else 'ok'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    storage = subparsers.add_parser("storage", help="Concurrent readers/writers before and after WAL tuning")
+    storage.add_argument("--duration", type=float, default=3.0, help="Seconds per concurrency level")
+    storage.add_argument("--levels", type=_parse_levels, default=_parse_levels("2x1,8x2,16x4,32x8"),
+                         help="Comma-separated READERSxWRITERS levels")
+    storage.add_argument("--seed", type=int, default=2000, help="Requests to seed before each level")
+
+    query_plans = subparsers.add_parser("query-plans", help="Check that request lookups use an index")
+    query_plans.add_argument("--seed", type=int, default=2000, help="Requests to seed before checking")
+
+    smtp = subparsers.add_parser("smtp", help="Messages per second with and without SMTP session reuse")
+    smtp.add_argument("--messages", type=int, default=500, help="Messages to send in each mode")
+
+    templates = subparsers.add_parser("templates", help="Render time per email template")
+    templates.add_argument("--messages", type=int, default=5000, help="Renders per template")
+
+    digest = subparsers.add_parser("digest", help="Messages sent per window with department-head digests")
+    digest.add_argument("--seed", type=int, default=2000, help="Requests to seed before the digest run")
+
+    login = subparsers.add_parser("login", help="Login latency of the role chain and the principals query")
+    login.add_argument("--users", type=int, default=10000, help="Registered users to seed")
+    login.add_argument("--attempts", type=int, default=2000, help="Logins per case")
+
+    cold_start = subparsers.add_parser("cold-start", help="Import, first query and first app run in fresh processes")
+    cold_start.add_argument("--runs", type=int, default=5, help="Fresh processes per step")
+
+    analytics_parser = subparsers.add_parser("analytics", help="Build and cache time of the consumption analytics")
+    analytics_parser.add_argument("--requests", type=int, default=100000, help="Requests to seed")
+
+    load = subparsers.add_parser("load", help="Latency percentiles and throughput of database operations at scale")
+    load.add_argument("--users", type=int, default=500, help="Users to seed")
+    load.add_argument("--departments", type=int, default=10, help="Departments to seed")
+    load.add_argument("--items", type=int, default=200, help="Items in the catalogue")
+    load.add_argument("--requests", type=int, default=20000, help="Requests to seed")
+    load.add_argument("--iterations", type=int, default=200, help="Calls per operation")
+    load.add_argument("--save", help="Write the results to this JSON file")
+    load.add_argument("--baseline", help="Fail if any p95 grew beyond --tolerance against this saved JSON file")
+    load.add_argument("--tolerance", type=float, default=1.5, help="Allowed p95 ratio against the baseline")
+
+    dashboards = subparsers.add_parser("dashboards", help="Render time, elements and database calls per dashboard")
+    dashboards.add_argument("--requests", type=int, default=2000, help="Requests to seed")
+    dashboards.add_argument("--runs", type=int, default=5, help="Reruns measured per dashboard")
+    dashboards.add_argument("--threshold-scale", type=float, default=1.0, help="Multiplier for every threshold")
+
+    args = parser.parse_args()
+    exit_code = 0
+    try:
+        if args.benchmark == "storage":
+            benchmark_storage(args.levels, args.duration, args.seed)
+        elif args.benchmark == "query-plans":
+            exit_code = 0 if check_query_plans(args.seed) else 1
+        elif args.benchmark == "smtp":
+            benchmark_smtp(args.messages)
+        elif args.benchmark == "templates":
+            benchmark_templates(args.messages)
+        elif args.benchmark == "digest":
+            benchmark_digest(args.seed)
+        elif args.benchmark == "login":
+            benchmark_login(args.users, args.attempts)
+        elif args.benchmark == "cold-start":
+            benchmark_cold_start(args.runs)
+        elif args.benchmark == "analytics":
+            benchmark_analytics(args.requests)
+        elif args.benchmark == "load":
+            ok = benchmark_load(args.users, args.departments, args.items, args.requests, args.iterations,
+                                args.save, args.baseline, args.tolerance)
+            exit_code = 0 if ok else 1
+        elif args.benchmark == "dashboards":
+            exit_code = 0 if benchmark_dashboards(args.requests, args.runs, args.threshold_scale) else 1
+    finally:
+        database.get_pool().close()
+        shutil.rmtree(_SCRATCH_DIR, ignore_errors=True)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,491 @@
 import sqlite3
-from datetime import datetime
-import pytz
+import atexit
+import functools
+import inspect
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
 
-# Database file
-DATABASE = "requests.db"
+# Database file (INVENTORY_DB_PATH overrides it per deployment)
+DATABASE = os.environ.get("INVENTORY_DB_PATH", "requests.db")
 
-# Initialize database and create tables if they don't exist
-def init_db():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+# Request lifecycle statuses
+REQUEST_STATUSES = [
+    "Pending Department Approval",
+    "Department Approved",
+    "Department Rejected",
+    "Admin Approved",
+    "Admin Rejected",
+    "Packing",
+    "Dispatched",
+    "Delivered",
+]
+
+# Connection pool settings
+POOL_SIZE = 8            # Maximum number of open connections
+POOL_TIMEOUT = 10.0      # Seconds to wait for a free connection; lock waits use STORAGE_SETTINGS["busy_timeout"]
+CONNECTION_PRAGMAS = {   # Applied once to every new connection, not on every checkout
+    "temp_store": "MEMORY",
+}
+
+# Storage tuning applied by init_db(). Each setting can be overridden per
+# deployment with an INVENTORY_DB_<SETTING> environment variable, e.g.
+# INVENTORY_DB_JOURNAL_MODE=DELETE or INVENTORY_DB_BUSY_TIMEOUT=10000.
+STORAGE_SETTINGS = {
+    "journal_mode": "WAL",        # Readers no longer block on an admin approval write
+    "synchronous": "NORMAL",      # Safe with WAL, fsync only at checkpoints
+    "busy_timeout": 5000,         # Milliseconds to wait on a lock before "database is locked"
+    "mmap_size": 268435456,       # 256 MB memory-mapped reads
+    "cache_size": -65536,         # 64 MB page cache per connection (negative = KiB)
+    "wal_autocheckpoint": 1000,   # Pages
+}
+for _setting in STORAGE_SETTINGS:
+    _override = os.environ.get(f"INVENTORY_DB_{_setting.upper()}")
+    if _override:
+        STORAGE_SETTINGS[_setting] = _override
+
+# Seconds between background wal_checkpoint/optimize runs (on a daemon thread)
+MAINTENANCE_INTERVAL = float(os.environ.get("INVENTORY_DB_MAINTENANCE_INTERVAL", 300))
+
+# Seconds between per-item stock balance snapshots (checked during maintenance)
+STOCK_SNAPSHOT_INTERVAL = float(os.environ.get("INVENTORY_STOCK_SNAPSHOT_INTERVAL", 86400))
+
+# Query instrumentation: per-function call statistics and a log of slow calls
+QUERY_STATS_ENABLED = os.environ.get("INVENTORY_QUERY_STATS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("INVENTORY_SLOW_QUERY_MS", 250))
+SLOW_QUERY_LOG_SIZE = 100                                  # Slow calls kept, newest first
+SLOW_QUERY_MAX_STATEMENTS = 20                             # SQL statements kept per slow call
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)  # Histogram upper bounds, plus one open bucket
+QUERY_STATS_FILE = os.environ.get("INVENTORY_QUERY_STATS_FILE")  # JSON dump written at exit if set
+
+# journal_mode is stored in the database file; the rest must be set per connection
+DATABASE_LEVEL_SETTINGS = ("journal_mode",)
+
+def connection_pragmas():
+    pragmas = dict(CONNECTION_PRAGMAS)
+    pragmas.update({name: value for name, value in STORAGE_SETTINGS.items() if name not in DATABASE_LEVEL_SETTINGS})
+    return pragmas
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections.
+
+    A thread holds at most one connection at a time: nested checkouts from the
+    same thread (e.g. a query function calling another one) reuse it, so every
+    Streamlit script thread works on its own connection until it is done.
+    """
+
+    def __init__(self, database, size=POOL_SIZE, timeout=POOL_TIMEOUT, pragmas=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(connection_pragmas() if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._open < self.size
+            if can_create:
+                self._open += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        start = time.perf_counter()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise sqlite3.OperationalError(
+                f"Connection pool exhausted: no connection available after {self.timeout}s"
+            )
+        finally:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._waits += 1
+                self._wait_time += waited
+                self._max_wait = max(self._max_wait, waited)
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._open -= 1
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        local = self._local
+        with self._lock:
+            self._checkouts += 1
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        local.conn = conn
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            local.conn = None
+            with self._lock:
+                self._in_use -= 1
+            self._release(conn)
+
+    def holds_connection(self):
+        return getattr(self._local, "conn", None) is not None
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._open -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "database": self.database,
+                "size": self.size,
+                "connections_open": self._open,
+                "connections_in_use": self._in_use,
+                "connections_idle": self._open - self._in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_ms": round(self._wait_time * 1000, 3),
+                "avg_wait_ms": round(self._wait_time * 1000 / self._waits, 3) if self._waits else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def configure_pool(database=None, size=None, timeout=None, pragmas=None):
+    # Replace the shared pool; idle connections of the old pool are closed
+    # immediately, checked-out ones when they are returned.
+    global _pool, DATABASE
+    with _pool_lock:
+        if database is not None:
+            DATABASE = database
+        old = _pool
+        _pool = ConnectionPool(
+            DATABASE,
+            size=size if size is not None else POOL_SIZE,
+            timeout=timeout if timeout is not None else POOL_TIMEOUT,
+            pragmas=pragmas,
+        )
+    if old is not None:
+        old.close()
+    # Cached data belongs to the old database
+    for name in list(_data_versions):
+        bump_data_version(name)
+    return _pool
+
+# Process-wide data versions. Writers bump a version after they commit and
+# caches keyed on it rebuild on their next read, so every session sees fresh
+# data while unchanged reads never touch SQLite.
+_data_versions = {}
+_data_versions_lock = threading.Lock()
+
+def bump_data_version(name):
+    with _data_versions_lock:
+        _data_versions[name] = _data_versions.get(name, 0) + 1
+        return _data_versions[name]
+
+def get_data_version(name):
+    # Registers the name so configure_pool() invalidates caches keyed on it
+    return _data_versions.setdefault(name, 0)
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE)
+    return _pool
+
+@contextmanager
+def get_connection():
+    pool = get_pool()
+    if _schema_ready_for is not pool:
+        _ensure_schema(pool)
+    nested = pool.holds_connection()
+    with pool.connection() as conn:
+        call = None if nested else getattr(_query_local, "call", None)
+        if call is None:
+            yield conn
+        else:
+            # Inside an instrumented call: keep its SQL for the slow-query log
+            # and count the rows it writes
+            changes = conn.total_changes
+            conn.set_trace_callback(call.trace)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+                call.changes += conn.total_changes - changes
+    if not nested:
+        _maybe_run_maintenance()
+
+def get_pool_stats():
+    return get_pool().stats()
+
+# Query instrumentation. Every public query function in this module is wrapped
+# by instrumented() (see the end of the file). Only the outermost call of a
+# thread is recorded, so nested calls count towards their caller.
+_query_local = threading.local()
+
+class _CallTrace:
+    def __init__(self):
+        self.statements = []
+        self.changes = 0
+
+    def trace(self, statement):
+        if len(self.statements) < SLOW_QUERY_MAX_STATEMENTS:
+            self.statements.append(" ".join(statement.split()))
+
+class QueryStats:
+    """Thread-safe call counts, latency histograms and slow-call log of the database functions."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, slow_ms=SLOW_QUERY_MS, log_size=SLOW_QUERY_LOG_SIZE):
+        self.buckets = tuple(buckets)
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._functions = {}
+        self._slow = deque(maxlen=log_size)
+        self._since = time.time()
+
+    def record(self, name, elapsed_ms, rows, changes, error=None, slow_entry=None):
+        bucket = next((i for i, bound in enumerate(self.buckets) if elapsed_ms <= bound), len(self.buckets))
+        with self._lock:
+            stats = self._functions.get(name)
+            if stats is None:
+                stats = self._functions[name] = {
+                    "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "changes": 0,
+                    "histogram": [0] * (len(self.buckets) + 1),
+                }
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["rows"] += rows
+            stats["changes"] += changes
+            stats["histogram"][bucket] += 1
+            if slow_entry is not None:
+                self._slow.appendleft(slow_entry)
+
+    def _percentile(self, stats, pct):
+        # Upper bound of the bucket holding the pct-th call (the maximum for the open bucket)
+        target = stats["calls"] * pct / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, stats["histogram"]):
+            seen += count
+            if seen >= target:
+                return min(bound, stats["max_ms"])
+        return stats["max_ms"]
+
+    def snapshot(self):
+        with self._lock:
+            functions = {name: dict(stats, histogram=list(stats["histogram"]))
+                         for name, stats in self._functions.items()}
+            slow = list(self._slow)
+        for stats in functions.values():
+            stats["total_ms"] = round(stats["total_ms"], 3)
+            stats["max_ms"] = round(stats["max_ms"], 3)
+            stats["avg_ms"] = round(stats["total_ms"] / stats["calls"], 3)
+            stats["p50_ms"] = round(self._percentile(stats, 50), 3)
+            stats["p95_ms"] = round(self._percentile(stats, 95), 3)
+        return {
+            "since": datetime.fromtimestamp(self._since, timezone.utc).isoformat(timespec="seconds"),
+            "enabled": QUERY_STATS_ENABLED,
+            "slow_query_ms": self.slow_ms,
+            "buckets_ms": list(self.buckets),
+            "functions": dict(sorted(functions.items(), key=lambda item: -item[1]["total_ms"])),
+            "slow_queries": slow,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._functions.clear()
+            self._slow.clear()
+            self._since = time.time()
+
+query_stats = QueryStats()
+
+def _rows_returned(result):
+    # Lists are result sets; a dict is a single record
+    if isinstance(result, list):
+        return len(result)
+    return 1 if isinstance(result, dict) and result else 0
+
+def _short_repr(value, limit=200):
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def instrumented(function):
+    # Records every outermost call of function in query_stats. Arguments and
+    # SQL of functions taking a password are never written to the slow log.
+    name = function.__name__
+    signature = inspect.signature(function)
+    secret = any("password" in parameter for parameter in signature.parameters)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not QUERY_STATS_ENABLED or getattr(_query_local, "call", None) is not None:
+            return function(*args, **kwargs)
+        call = _query_local.call = _CallTrace()
+        result = error = None
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+            return result
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _query_local.call = None
+            slow_entry = None
+            if elapsed_ms >= query_stats.slow_ms:
+                try:
+                    arguments = signature.bind_partial(*args, **kwargs).arguments
+                except TypeError:
+                    # Arguments that do not fit the signature (the call itself raised);
+                    # log them as passed instead of replacing the real error
+                    arguments = {"*args": args, **kwargs}
+                slow_entry = {
+                    "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "function": name,
+                    "ms": round(elapsed_ms, 3),
+                    "rows": _rows_returned(result),
+                    "changes": call.changes,
+                    "error": error,
+                    "arguments": {key: "***" if "password" in key or (secret and key == "*args")
+                                  else _short_repr(value) for key, value in arguments.items()},
+                    "statements": ["[redacted]"] if secret else call.statements,
+                    "thread": threading.current_thread().name,
+                }
+            query_stats.record(name, elapsed_ms, _rows_returned(result), call.changes, error, slow_entry)
+
+    return wrapper
+
+def configure_query_stats(enabled=None, slow_query_ms=None):
+    global QUERY_STATS_ENABLED
+    if enabled is not None:
+        QUERY_STATS_ENABLED = bool(enabled)
+    if slow_query_ms is not None:
+        query_stats.slow_ms = float(slow_query_ms)
+
+def get_query_stats():
+    return query_stats.snapshot()
+
+def reset_query_stats():
+    query_stats.reset()
+
+def dump_query_stats(path=None):
+    # Returns the statistics (plus pool counters) as JSON, also writing them to path if given
+    data = dict(get_query_stats(), pool=get_pool_stats() if _pool is not None else None)
+    text = json.dumps(data, indent=2, default=str)
+    if path:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
+
+if QUERY_STATS_FILE:
+    atexit.register(dump_query_stats, QUERY_STATS_FILE)
+
+# Storage tuning and maintenance
+_maintenance_lock = threading.Lock()
+_last_maintenance = time.monotonic()
+
+def tune_storage(conn):
+    # Apply the database-level settings; returns the journal mode actually in effect
+    for name in DATABASE_LEVEL_SETTINGS:
+        conn.execute(f"PRAGMA {name} = {STORAGE_SETTINGS[name]}")
+    return conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+def run_storage_maintenance():
+    # Fold the WAL back into the database file and refresh planner statistics
+    global _last_maintenance
+    with get_pool().connection() as conn:
+        checkpoint = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        conn.execute("PRAGMA optimize")
+    _last_maintenance = time.monotonic()
+    return {"busy": checkpoint[0], "wal_pages": checkpoint[1], "checkpointed_pages": checkpoint[2]}
+
+def _run_maintenance():
+    # Body of the background maintenance thread; the lock was taken by the
+    # request thread that started it
+    try:
+        if time.monotonic() - _last_maintenance >= MAINTENANCE_INTERVAL:
+            run_storage_maintenance()
+            if stock_snapshot_due():
+                take_stock_snapshot()
+    except sqlite3.Error as e:
+        print(f"Storage maintenance failed: {str(e)}")
+    finally:
+        _maintenance_lock.release()
+
+def _maybe_run_maintenance():
+    # Checked after every connection checkout; the checkpoint, optimize and
+    # stock snapshot run on a daemon thread so no request waits for them
+    if time.monotonic() - _last_maintenance < MAINTENANCE_INTERVAL:
+        return
+    if not _maintenance_lock.acquire(blocking=False):
+        return
+    try:
+        threading.Thread(target=_run_maintenance, name="storage-maintenance", daemon=True).start()
+    except RuntimeError:
+        _maintenance_lock.release()
+        raise
 
+# Schema migrations. Each migration runs once, in order, inside its own
+# transaction; the applied versions are recorded in schema_version.
+def _migration_001_base_schema(cursor):
     # Users table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -77,11 +553,6 @@ def init_db():
     ]
     cursor.executemany("INSERT OR IGNORE INTO items (particular, quantity) VALUES (?, ?)", default_items)
 
-    # Verify insertion
-    cursor.execute("SELECT COUNT(*) FROM items")
-    item_count = cursor.fetchone()[0]
-    print(f"Initialized {item_count} items in the database.")
-
     # Requests table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS request (
@@ -112,289 +583,1116 @@ def init_db():
         )
     """)
 
-    conn.commit()
-    conn.close()
+def _migration_002_request_lookup_indexes(cursor):
+    # get_requests_by_emp_id / display_my_orders
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_request_emp_created ON request (emp_id, created_at, id)")
+    # get_requests_by_department and department dashboards filtered by status
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_request_dept_status_created ON request (department, status, created_at, id)")
+    # Status filtering in admin_dashboard / store_dashboard
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_request_status_created ON request (status, created_at, id)")
+
+def _migration_003_department_page_index(cursor):
+    # Department dashboards page through every status newest first
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_request_dept_created ON request (department, created_at, id)")
+
+def _migration_004_email_outbox(cursor):
+    # Durable queue of notification emails, delivered by mail.OutboxWorker
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON email_outbox (status, next_attempt_at)")
+
+def _migration_005_notification_events(cursor):
+    # Request events collected for the department-head digest
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notification_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            department TEXT NOT NULL,
+            request_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            digested_at TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notification_events_pending
+        ON notification_events (department, id) WHERE digested_at IS NULL
+    """)
+
+def _migration_006_principals(cursor):
+    # One view over every account type so login is a single indexed lookup.
+    # precedence keeps the order login() used to try the roles in.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_department_heads_username ON department_heads (username)")
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS principals AS
+            SELECT username AS login, password, 'admin' AS role, NULL AS department, NULL AS emp_id, 1 AS precedence
+            FROM admin
+            UNION ALL
+            SELECT username, password, 'store', NULL, NULL, 2 FROM store
+            UNION ALL
+            SELECT username, password, 'dept_head', department, NULL, 3 FROM department_heads
+            UNION ALL
+            SELECT email, password, 'user', NULL, emp_id, 4 FROM users
+    """)
+
+def _migration_007_stock_reservations(cursor):
+    # Stock held by open requests: available = items.quantity - SUM(held)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            request_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (request_id, item_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservations_item ON stock_reservations (item_id, quantity)")
+    # Requests still waiting for approval hold their items
+    cursor.execute("""
+        INSERT OR IGNORE INTO stock_reservations (request_id, item_id, quantity)
+        SELECT ri.request_id, ri.item_id, ri.quantity
+        FROM request_items ri JOIN request r ON r.id = ri.request_id
+        WHERE r.status IN ('Pending Department Approval', 'Department Approved')
+    """)
+
+def _migration_008_stock_ledger(cursor):
+    # Append-only stock movements (signed quantities) and periodic per-item
+    # balance snapshots; see the stock ledger functions below
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('opening', 'receipt', 'issue', 'adjustment')),
+            quantity INTEGER NOT NULL,
+            request_id INTEGER,
+            note TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movements_item ON stock_movements (item_id, id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            taken_at TIMESTAMP NOT NULL,
+            item_id INTEGER NOT NULL,
+            balance INTEGER NOT NULL,
+            issued_total INTEGER NOT NULL,
+            last_movement_id INTEGER NOT NULL,
+            PRIMARY KEY (taken_at, item_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_item ON stock_snapshots (item_id, taken_at)")
+    # The current quantities become the opening balances and the first snapshot
+    cursor.execute("""
+        INSERT INTO stock_movements (item_id, kind, quantity, note)
+        SELECT id, 'opening', quantity, 'Balance when the stock ledger was introduced' FROM items
+    """)
+    cursor.execute("""
+        INSERT INTO stock_snapshots (taken_at, item_id, balance, issued_total, last_movement_id)
+        SELECT CURRENT_TIMESTAMP, id, quantity, 0, (SELECT COALESCE(MAX(id), 0) FROM stock_movements) FROM items
+    """)
+
+def _migration_009_outbox_claim_lease(cursor):
+    # When a worker claimed a 'sending' message, so only claims older than a
+    # lease are taken back from a worker that stopped mid-delivery
+    cursor.execute("ALTER TABLE email_outbox ADD COLUMN claimed_at TIMESTAMP")
+
+MIGRATIONS = [
+    (1, "base schema", _migration_001_base_schema),
+    (2, "request lookup indexes", _migration_002_request_lookup_indexes),
+    (3, "department keyset pagination index", _migration_003_department_page_index),
+    (4, "email outbox", _migration_004_email_outbox),
+    (5, "notification events", _migration_005_notification_events),
+    (6, "principals view", _migration_006_principals),
+    (7, "stock reservations", _migration_007_stock_reservations),
+    (8, "stock movements and snapshots", _migration_008_stock_ledger),
+    (9, "email outbox claim lease", _migration_009_outbox_claim_lease),
+]
+
+def get_schema_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def run_migrations(conn):
+    # Returns the versions applied by this call
+    applied = []
+    current = get_schema_version(conn)
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the write lock
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            migrate(conn.cursor())
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+# Schema initialisation is lazy: the first get_connection() on a pool tunes
+# storage and applies pending migrations, so importing this module does no
+# I/O and later connections skip the check entirely.
+_schema_ready_for = None
+_schema_lock = threading.Lock()
+
+def _ensure_schema(pool):
+    global _schema_ready_for
+    with _schema_lock:
+        if _schema_ready_for is pool:
+            return
+        with pool.connection() as conn:
+            journal_mode = tune_storage(conn)
+            if journal_mode.lower() != str(STORAGE_SETTINGS["journal_mode"]).lower():
+                print(f"Could not switch database to {STORAGE_SETTINGS['journal_mode']} mode (using {journal_mode}).")
+            if run_migrations(conn):
+                bump_data_version(CATALOGUE)
+                bump_data_version(PRINCIPALS)
+        _schema_ready_for = pool
+
+# Initialize database and bring the schema up to date. Optional: any
+# database call does this on first use.
+def init_db():
+    global _schema_ready_for
+    _schema_ready_for = None
+    _ensure_schema(get_pool())
 
 # User functions
 def register_user(email, emp_id, password):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO users (email, emp_id, password) VALUES (?, ?, ?)", (email, emp_id, password))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO users (email, emp_id, password) VALUES (?, ?, ?)", (email, emp_id, password))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 def login_user(email, password):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT email, emp_id FROM users WHERE email = ? AND password = ?", (email, password))
-    user = cursor.fetchone()
-    conn.close()
-    return {"email": user[0], "emp_id": user[1]} if user else None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email, emp_id FROM users WHERE email = ? AND password = ?", (email, password))
+        user = cursor.fetchone()
+        return {"email": user[0], "emp_id": user[1]} if user else None
+
+def authenticate_principal(login, password):
+    # Returns {"role", "login", "department", "emp_id"} for the first account
+    # (admin, store, department head, user) matching login and password
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT role, login, department, emp_id FROM principals
+            WHERE login = ? AND password = ?
+            ORDER BY precedence LIMIT 1
+        """, (login, password))
+        row = cursor.fetchone()
+        return {"role": row[0], "login": row[1], "department": row[2], "emp_id": row[3]} if row else None
 
 def get_all_users():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT emp_id, email FROM users")
-    users = cursor.fetchall()
-    conn.close()
-    return users
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT emp_id, email FROM users")
+        users = cursor.fetchall()
+        return users
 
 def delete_user(emp_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE emp_id = ?", (emp_id,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM users WHERE emp_id = ?", (emp_id,))
+        conn.commit()
+        success = cursor.rowcount > 0
+        return success
 
 def update_user_password(emp_id, new_password):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET password = ? WHERE emp_id = ?", (new_password, emp_id))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET password = ? WHERE emp_id = ?", (new_password, emp_id))
+        conn.commit()
+        success = cursor.rowcount > 0
+        return success
+
+# Principal directory: department heads plus the admin and store accounts,
+# cached per process like the item catalogue and rebuilt when any of them
+# changes. Department heads are also indexed by username for login.
+PRINCIPALS = "principals"
+_principal_cache = {"version": None}
+
+def get_principal_directory():
+    # The returned dictionaries are shared between sessions and must not be modified
+    global _principal_cache
+    version = get_data_version(PRINCIPALS)
+    cache = _principal_cache
+    if cache["version"] == version:
+        return cache
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT department, username, password, email FROM department_heads")
+        heads = {row[0]: {"username": row[1], "password": row[2], "email": row[3]} for row in cursor.fetchall()}
+        cursor.execute("SELECT username, password FROM admin LIMIT 1")
+        admin = cursor.fetchone()
+        cursor.execute("SELECT username, password FROM store LIMIT 1")
+        store = cursor.fetchone()
+    _principal_cache = {
+        "version": version,
+        "department_heads": heads,
+        "heads_by_username": {creds["username"]: (department, creds) for department, creds in heads.items()},
+        "admin": {"username": admin[0], "password": admin[1]} if admin else {"username": "admin", "password": "admin123"},
+        "store": {"username": store[0], "password": store[1]} if store else {"username": "store", "password": "store123"},
+    }
+    return _principal_cache
+
+def find_department_head(username):
+    # Returns (department, credentials) for a department-head username, or None
+    return get_principal_directory()["heads_by_username"].get(username)
 
 # Department Head functions
 def get_all_department_heads():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT department, username, password, email FROM department_heads")
-    heads = {row[0]: {"username": row[1], "password": row[2], "email": row[3]} for row in cursor.fetchall()}
-    conn.close()
-    return heads
+    heads = get_principal_directory()["department_heads"]
+    return {department: dict(creds) for department, creds in heads.items()}
 
 def add_department_head(department, username, password, email):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO department_heads (department, username, password, email) VALUES (?, ?, ?, ?)",
-                       (department, username, password, email))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO department_heads (department, username, password, email) VALUES (?, ?, ?, ?)",
+                           (department, username, password, email))
+            conn.commit()
+            bump_data_version(PRINCIPALS)
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 def update_department_head_password(department, new_password):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE department_heads SET password = ? WHERE department = ?", (new_password, department))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE department_heads SET password = ? WHERE department = ?", (new_password, department))
+        conn.commit()
+        success = cursor.rowcount > 0
+        if success:
+            bump_data_version(PRINCIPALS)
+        return success
 
 def update_department_head_email(department, new_email):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE department_heads SET email = ? WHERE department = ?", (new_email, department))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE department_heads SET email = ? WHERE department = ?", (new_email, department))
+        conn.commit()
+        success = cursor.rowcount > 0
+        if success:
+            bump_data_version(PRINCIPALS)
+        return success
 
 def delete_department_head(department):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM department_heads WHERE department = ?", (department,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM department_heads WHERE department = ?", (department,))
+        conn.commit()
+        success = cursor.rowcount > 0
+        if success:
+            bump_data_version(PRINCIPALS)
+        return success
 
 # Admin functions
 def get_admin_credentials():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, password FROM admin LIMIT 1")
-    admin = cursor.fetchone()
-    conn.close()
-    return {"username": admin[0], "password": admin[1]} if admin else {"username": "admin", "password": "admin123"}
+    return dict(get_principal_directory()["admin"])
 
 def update_admin_password(new_password):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE admin SET password = ? WHERE username = 'admin'", (new_password,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE admin SET password = ? WHERE username = 'admin'", (new_password,))
+        conn.commit()
+        success = cursor.rowcount > 0
+        if success:
+            bump_data_version(PRINCIPALS)
+        return success
 
 # Store functions
 def get_store_credentials():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, password FROM store LIMIT 1")
-    store = cursor.fetchone()
-    conn.close()
-    return {"username": store[0], "password": store[1]} if store else {"username": "store", "password": "store123"}
+    return dict(get_principal_directory()["store"])
 
 def update_store_password(new_password):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE store SET password = ? WHERE username = 'store'", (new_password,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE store SET password = ? WHERE username = 'store'", (new_password,))
+        conn.commit()
+        success = cursor.rowcount > 0
+        if success:
+            bump_data_version(PRINCIPALS)
+        return success
 
 # Item functions
+CATALOGUE = "catalogue"
+_catalogue_cache = {"version": None, "items": []}
+
 def get_all_items():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, particular, quantity FROM items WHERE quantity > 0")
-    items = [{"id": row[0], "particular": row[1], "quantity": row[2]} for row in cursor.fetchall()]
-    conn.close()
+    # Served from the process-wide cache until the catalogue version changes.
+    # The returned list is shared between sessions and must not be modified.
+    global _catalogue_cache
+    version = get_data_version(CATALOGUE)
+    cache = _catalogue_cache
+    if cache["version"] == version:
+        return cache["items"]
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT i.id, i.particular, i.quantity, COALESCE(r.reserved, 0)
+            FROM items i
+            LEFT JOIN (SELECT item_id, SUM(quantity) AS reserved FROM stock_reservations GROUP BY item_id) r
+                ON r.item_id = i.id
+            WHERE i.quantity > 0
+        """)
+        items = [{"id": row[0], "particular": row[1], "quantity": row[2], "reserved": row[3],
+                  "available": max(row[2] - row[3], 0)} for row in cursor.fetchall()]
+    _catalogue_cache = {"version": version, "items": items}
     return items
 
 def add_item(particular, quantity):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO items (particular, quantity) VALUES (?, ?)", (particular, quantity))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO items (particular, quantity) VALUES (?, ?)", (particular, quantity))
+            _record_stock_movement(cursor, cursor.lastrowid, "receipt", quantity, note="New item")
+            conn.commit()
+            bump_data_version(CATALOGUE)
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 def remove_item(item_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM items WHERE id = ?", (item_id,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
-
-def update_item_quantity(item_id, new_quantity):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE items SET quantity = ? WHERE id = ?", (new_quantity, item_id))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # The write lock is taken before the read, so the ledger delta
+            # cannot be computed from a quantity another writer just changed
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT quantity FROM items WHERE id = ?", (item_id,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                _record_stock_movement(cursor, item_id, "adjustment", -row[0], note="Item removed")
+            cursor.execute("DELETE FROM items WHERE id = ?", (item_id,))
+            success = cursor.rowcount > 0
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Database error: {str(e)}")
+            return False
+        if success:
+            bump_data_version(CATALOGUE)
+        return success
 
-# Request functions
-def insert_request(name, email, emp_id, department, items, description, suggestion):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    try:
+def update_item_quantity(item_id, new_quantity, kind="adjustment", note=None):
+    # kind: 'adjustment' for a stock count correction, 'receipt' for goods received
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # Read and write under one write lock (see remove_item)
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT quantity FROM items WHERE id = ?", (item_id,))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return False
+            cursor.execute("UPDATE items SET quantity = ? WHERE id = ?", (new_quantity, item_id))
+            if new_quantity != row[0]:
+                _record_stock_movement(cursor, item_id, kind, new_quantity - row[0], note=note)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Database error: {str(e)}")
+            return False
+        bump_data_version(CATALOGUE)
+        return True
+
+# Stock ledger. Every change to items.quantity is also appended to
+# stock_movements as a signed delta, and take_stock_snapshot() periodically
+# stores each item's balance and cumulative issues. Historical questions are
+# answered from the nearest snapshot plus the movements recorded after it,
+# instead of replaying the whole ledger.
+STOCK_MOVEMENT_KINDS = ["opening", "receipt", "issue", "adjustment"]
+
+def _record_stock_movement(cursor, item_id, kind, quantity, request_id=None, note=None):
+    # Must run inside the transaction that changes items.quantity
+    cursor.execute("""
+        INSERT INTO stock_movements (item_id, kind, quantity, request_id, note)
+        VALUES (?, ?, ?, ?, ?)
+    """, (item_id, kind, quantity, request_id, note))
+
+def _ledger_timestamp(value):
+    # Ledger timestamps are SQLite CURRENT_TIMESTAMP strings (UTC)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return f"{value.isoformat()} 23:59:59"
+    return value
+
+def get_stock_movements(item_id=None, limit=100):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        query = """
+            SELECT m.id, m.item_id, COALESCE(i.particular, 'Item ' || m.item_id), m.kind,
+                   m.quantity, m.request_id, m.note, m.created_at
+            FROM stock_movements m
+            LEFT JOIN items i ON i.id = m.item_id
+        """
+        params = []
+        if item_id is not None:
+            query += " WHERE m.item_id = ?"
+            params.append(item_id)
+        query += " ORDER BY m.id DESC LIMIT ?"
+        params.append(limit)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+def get_latest_stock_snapshot_time():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(taken_at) FROM stock_snapshots")
+        return cursor.fetchone()[0]
+
+def stock_snapshot_due():
+    with get_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO request (name, email, emp_id, department, description, suggestion)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (name, email, emp_id, department, description, suggestion))
-        
-        request_id = cursor.lastrowid
-        
-        for item in items:
-            cursor.execute("INSERT INTO request_items (request_id, item_id, quantity) VALUES (?, ?, ?)",
-                           (request_id, item["item_id"], item["quantity"]))
-        
-        conn.commit()
-        return True, "Request inserted successfully"
-    except sqlite3.Error as e:
-        conn.rollback()
-        print(f"Database error: {str(e)}")
-        return False, f"Database error: {str(e)}"
-    finally:
-        conn.close()
+            SELECT MAX(taken_at) IS NULL
+                OR (julianday('now') - julianday(MAX(taken_at))) * 86400 >= ?
+            FROM stock_snapshots
+        """, (STOCK_SNAPSHOT_INTERVAL,))
+        return bool(cursor.fetchone()[0])
+
+def take_stock_snapshot():
+    # Records the current balance and cumulative issued quantity (previous
+    # snapshot + issues since) of every item with ledger history, including
+    # removed items, so each snapshot is a complete anchor for
+    # _ledger_position(). Returns the number of items captured.
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements")
+            last_movement_id = cursor.fetchone()[0]
+            cursor.execute("SELECT taken_at, last_movement_id FROM stock_snapshots ORDER BY taken_at DESC LIMIT 1")
+            previous_taken_at, previous_movement_id = cursor.fetchone() or (None, 0)
+            cursor.execute("""
+                INSERT OR REPLACE INTO stock_snapshots (taken_at, item_id, balance, issued_total, last_movement_id)
+                SELECT CURRENT_TIMESTAMP, ledger.item_id, COALESCE(i.quantity, 0),
+                       COALESCE(prev.issued_total, 0) + COALESCE((
+                           SELECT -SUM(m.quantity) FROM stock_movements m
+                           WHERE m.item_id = ledger.item_id AND m.kind = 'issue'
+                             AND m.id > :previous_movement_id AND m.id <= :last_movement_id
+                       ), 0),
+                       :last_movement_id
+                FROM (
+                    SELECT id AS item_id FROM items
+                    UNION SELECT item_id FROM stock_snapshots WHERE taken_at = :previous_taken_at
+                    UNION SELECT item_id FROM stock_movements
+                    WHERE id > :previous_movement_id AND id <= :last_movement_id
+                ) ledger
+                LEFT JOIN items i ON i.id = ledger.item_id
+                LEFT JOIN stock_snapshots prev
+                    ON prev.taken_at = :previous_taken_at AND prev.item_id = ledger.item_id
+            """, {"previous_taken_at": previous_taken_at, "previous_movement_id": previous_movement_id,
+                  "last_movement_id": last_movement_id})
+            count = cursor.rowcount
+            conn.commit()
+            return count
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+def _ledger_position(cursor, as_of, item_id):
+    # Per-item (balance, issued_total) at as_of: the latest snapshot taken at
+    # or before as_of plus the movements recorded after it up to as_of. Only
+    # movements after the snapshot are read (a rowid range, or
+    # idx_movements_item for one item); before the first snapshot the whole
+    # ledger is replayed.
+    item_filter = "" if item_id is None else " AND {}item_id = :item_id"
+    cursor.execute(f"""
+        WITH anchor AS (
+            SELECT taken_at, last_movement_id FROM stock_snapshots
+            WHERE taken_at <= :as_of
+            ORDER BY taken_at DESC LIMIT 1
+        ),
+        positions AS (
+            SELECT s.item_id, s.balance, s.issued_total AS issued
+            FROM stock_snapshots s
+            WHERE s.taken_at = (SELECT taken_at FROM anchor){item_filter.format("s.")}
+            UNION ALL
+            SELECT item_id, quantity, CASE WHEN kind = 'issue' THEN -quantity ELSE 0 END
+            FROM stock_movements
+            WHERE id > COALESCE((SELECT last_movement_id FROM anchor), 0)
+              AND created_at <= :as_of{item_filter.format("")}
+        )
+        SELECT item_id, SUM(balance), SUM(issued) FROM positions GROUP BY item_id
+    """, {"as_of": as_of, "item_id": item_id})
+    return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
 
-def get_requests_by_emp_id(emp_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+def get_stock_as_of(as_of, item_id=None):
+    # Returns {item_id: balance} at as_of (a datetime, a date meaning end of
+    # that day, or a UTC 'YYYY-MM-DD HH:MM:SS' string)
+    with get_connection() as conn:
+        positions = _ledger_position(conn.cursor(), _ledger_timestamp(as_of), item_id)
+        return {key: balance for key, (balance, _) in positions.items()}
+
+def get_item_consumption(start, end, item_id=None):
+    # Returns {item_id: quantity issued in (start, end]}, omitting items with
+    # no issues in the period
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        before = _ledger_position(cursor, _ledger_timestamp(start), item_id)
+        after = _ledger_position(cursor, _ledger_timestamp(end), item_id)
+        consumption = {}
+        for key, (_, issued) in after.items():
+            used = issued - before.get(key, (0, 0))[1]
+            if used:
+                consumption[key] = used
+        return consumption
+
+# Stock reservations. Open requests hold their items in stock_reservations
+# from submission until they are rejected, deleted or approved, so the
+# stock available to new requests is on-hand minus held.
+RESERVATION_RELEASE_STATUSES = ("Department Rejected", "Admin Rejected")
+
+def _available_stock(cursor, item_id):
+    # (particular, available) or None; one lookup on items plus idx_reservations_item
     cursor.execute("""
-        SELECT id, created_at, description, status, updated_at, delivered_to 
-        FROM request 
-        WHERE emp_id = ?
-    """, (emp_id,))
-    requests = [{"id": row[0], "created_at": row[1], "description": row[2], "status": row[3], 
-                 "updated_at": row[4], "delivered_to": row[5]} for row in cursor.fetchall()]
-    conn.close()
-    return requests
+        SELECT particular,
+               quantity - COALESCE((SELECT SUM(quantity) FROM stock_reservations WHERE item_id = items.id), 0)
+        FROM items WHERE id = ?
+    """, (item_id,))
+    return cursor.fetchone()
+
+def get_available_quantity(item_id):
+    with get_connection() as conn:
+        stock = _available_stock(conn.cursor(), item_id)
+        return stock[1] if stock else None
+
+def get_request_reservations(request_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT item_id, quantity FROM stock_reservations WHERE request_id = ?", (request_id,))
+        return dict(cursor.fetchall())
+
+# Request functions
+def insert_request(name, email, emp_id, department, items, description, suggestion):
+    # Inserts the request and reserves its items in one transaction; fails
+    # without writing anything if any item has less stock available than requested
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            shortages = []
+            for item in items:
+                stock = _available_stock(cursor, item["item_id"])
+                if stock is None:
+                    shortages.append(f"item ID {item['item_id']} not in inventory")
+                elif stock[1] < item["quantity"]:
+                    shortages.append(f"{stock[0]} (requested {item['quantity']}, available {stock[1]})")
+            if shortages:
+                conn.rollback()
+                return False, f"Insufficient stock: {', '.join(shortages)}"
+
+            cursor.execute("""
+                INSERT INTO request (name, email, emp_id, department, description, suggestion)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, email, emp_id, department, description, suggestion))
+            
+            request_id = cursor.lastrowid
+            
+            for item in items:
+                cursor.execute("INSERT INTO request_items (request_id, item_id, quantity) VALUES (?, ?, ?)",
+                               (request_id, item["item_id"], item["quantity"]))
+            cursor.execute("""
+                INSERT INTO stock_reservations (request_id, item_id, quantity)
+                SELECT request_id, item_id, quantity FROM request_items WHERE request_id = ?
+            """, (request_id,))
+            _record_notification_event(cursor, request_id, "Pending Department Approval")
+            
+            conn.commit()
+            bump_data_version(CATALOGUE)
+            bump_data_version(REQUESTS)
+            return True, "Request inserted successfully"
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Database error: {str(e)}")
+            return False, f"Database error: {str(e)}"
+
+# Bumped by every request write; caches of request-derived data key on it
+REQUESTS = "requests"
+
+# Keyset pagination: pages are ordered newest first and a cursor is the
+# (created_at, id) of the last row of the previous page.
+PAGE_ORDER = " ORDER BY created_at DESC, id DESC"
+
+def page_cursor(request):
+    return (request["created_at"], request["id"])
+
+def _keyset_filter(before):
+    if before is None:
+        return "", []
+    return " AND (created_at, id) < (?, ?)", [before[0], before[1]]
+
+def _limit_clause(limit):
+    if limit is None:
+        return "", []
+    return " LIMIT ?", [limit]
+
+def get_requests_by_emp_id(emp_id, limit=None, before=None):
+    keyset_sql, keyset_params = _keyset_filter(before)
+    limit_sql, limit_params = _limit_clause(limit)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, created_at, description, status, updated_at, delivered_to 
+            FROM request 
+            WHERE emp_id = ?
+        """ + keyset_sql + PAGE_ORDER + limit_sql, [emp_id] + keyset_params + limit_params)
+        requests = [{"id": row[0], "created_at": row[1], "description": row[2], "status": row[3], 
+                     "updated_at": row[4], "delivered_to": row[5]} for row in cursor.fetchall()]
+        return requests
 
 def get_all_requests():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, emp_id, name, department, email, description, suggestion, status, created_at, updated_at, delivered_to 
-        FROM request
-    """)
-    requests = [{"id": row[0], "emp_id": row[1], "name": row[2], "department": row[3], "email": row[4], 
-                 "description": row[5], "suggestion": row[6], "status": row[7], "created_at": row[8], 
-                 "updated_at": row[9], "delivered_to": row[10]} for row in cursor.fetchall()]
-    conn.close()
-    return requests
-
-def get_requests_by_department(department):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, emp_id, name, email, description, status, created_at, updated_at 
-        FROM request 
-        WHERE department = ?
-    """, (department,))
-    requests = [{"id": row[0], "emp_id": row[1], "name": row[2], "email": row[3], "description": row[4], 
-                 "status": row[5], "created_at": row[6], "updated_at": row[7]} for row in cursor.fetchall()]
-    conn.close()
-    return requests
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, emp_id, name, department, email, description, suggestion, status, created_at, updated_at, delivered_to 
+            FROM request
+        """)
+        requests = [{"id": row[0], "emp_id": row[1], "name": row[2], "department": row[3], "email": row[4], 
+                     "description": row[5], "suggestion": row[6], "status": row[7], "created_at": row[8], 
+                     "updated_at": row[9], "delivered_to": row[10]} for row in cursor.fetchall()]
+        return requests
+
+def get_request(request_id):
+    # A single request with the same keys as the list queries, or None once it is deleted
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, emp_id, name, department, email, description, suggestion, status, created_at, updated_at, delivered_to 
+            FROM request
+            WHERE id = ?
+        """, (request_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "emp_id": row[1], "name": row[2], "department": row[3], "email": row[4], 
+                "description": row[5], "suggestion": row[6], "status": row[7], "created_at": row[8], 
+                "updated_at": row[9], "delivered_to": row[10]}
+
+def get_requests_by_status(statuses, limit=None, before=None):
+    statuses = list(statuses)
+    if not statuses:
+        return []
+    columns = "id, emp_id, name, department, email, description, suggestion, status, created_at, updated_at, delivered_to"
+    keyset_sql, keyset_params = _keyset_filter(before)
+    limit_sql, limit_params = _limit_clause(limit)
+    if limit is None:
+        placeholders = ", ".join("?" for _ in statuses)
+        query = f"SELECT {columns} FROM request WHERE status IN ({placeholders})" + keyset_sql + PAGE_ORDER
+        params = statuses + keyset_params
+    else:
+        # One index range per status, each stopping after `limit` rows, so a
+        # page never has to sort the full history of e.g. Delivered requests
+        per_status = f"SELECT * FROM (SELECT {columns} FROM request WHERE status = ?" + keyset_sql + PAGE_ORDER + limit_sql + ")"
+        query = f"SELECT {columns} FROM (" + " UNION ALL ".join(per_status for _ in statuses) + ")" + PAGE_ORDER + limit_sql
+        params = []
+        for status in statuses:
+            params += [status] + keyset_params + limit_params
+        params += limit_params
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        requests = [{"id": row[0], "emp_id": row[1], "name": row[2], "department": row[3], "email": row[4], 
+                     "description": row[5], "suggestion": row[6], "status": row[7], "created_at": row[8], 
+                     "updated_at": row[9], "delivered_to": row[10]} for row in cursor.fetchall()]
+        return requests
+
+def get_requests_by_department(department, limit=None, before=None):
+    keyset_sql, keyset_params = _keyset_filter(before)
+    limit_sql, limit_params = _limit_clause(limit)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, emp_id, name, email, description, status, created_at, updated_at 
+            FROM request 
+            WHERE department = ?
+        """ + keyset_sql + PAGE_ORDER + limit_sql, [department] + keyset_params + limit_params)
+        requests = [{"id": row[0], "emp_id": row[1], "name": row[2], "email": row[3], "description": row[4], 
+                     "status": row[5], "created_at": row[6], "updated_at": row[7]} for row in cursor.fetchall()]
+        return requests
+
+def get_department_requester_emails(department):
+    # Everyone who has made a request in the department, without loading the requests
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT email FROM request WHERE department = ? ORDER BY email", (department,))
+        return [row[0] for row in cursor.fetchall()]
+
+def get_request_status_counts(statuses, department=None):
+    # Requests per status, answered from the (status, ...) and (department, status, ...) indexes
+    statuses = list(statuses)
+    if not statuses:
+        return {}
+    placeholders = ", ".join("?" for _ in statuses)
+    query = f"SELECT status, COUNT(*) FROM request WHERE status IN ({placeholders})"
+    params = statuses
+    if department is not None:
+        query += " AND department = ?"
+        params = statuses + [department]
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query + " GROUP BY status", params)
+        counts = dict(cursor.fetchall())
+        return {status: counts.get(status, 0) for status in statuses}
 
 def update_request_status(request_id, status, delivered_to=None):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    try:
-        if delivered_to:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if delivered_to:
+                cursor.execute("""
+                    UPDATE request 
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP, delivered_to = ? 
+                    WHERE id = ?
+                """, (status, delivered_to, request_id))
+            else:
+                cursor.execute("""
+                    UPDATE request 
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP 
+                    WHERE id = ?
+                """, (status, request_id))
+            released = 0
+            if status in RESERVATION_RELEASE_STATUSES:
+                cursor.execute("DELETE FROM stock_reservations WHERE request_id = ?", (request_id,))
+                released = cursor.rowcount
+            _record_notification_event(cursor, request_id, status)
+            conn.commit()
+            if released:
+                bump_data_version(CATALOGUE)
+            bump_data_version(REQUESTS)
+            return True, "Status updated"
+        except sqlite3.Error as e:
+            conn.rollback()
+            return False, f"Database error: {str(e)}"
+
+def approve_request(request_id):
+    # Admin approval in one transaction: the status flip and the stock
+    # decrement of every line item either both happen or neither does.
+    # Returns (success, message, {item_id: new_quantity}).
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT status FROM request WHERE id = ?", (request_id,))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return False, f"Request {request_id} not found", {}
+            if row[0] != "Department Approved":
+                conn.rollback()
+                return False, f"Request {request_id} is '{row[0]}', not 'Department Approved'", {}
+
+            cursor.execute("""
+                SELECT ri.item_id, i.particular, i.quantity, ri.quantity
+                FROM request_items ri
+                LEFT JOIN items i ON i.id = ri.item_id
+                WHERE ri.request_id = ? AND (i.id IS NULL OR i.quantity < ri.quantity)
+            """, (request_id,))
+            shortages = cursor.fetchall()
+            if shortages:
+                conn.rollback()
+                details = ", ".join(
+                    f"item ID {item_id} not in inventory" if particular is None
+                    else f"{particular} (requested {requested}, in stock {in_stock})"
+                    for item_id, particular, in_stock, requested in shortages
+                )
+                return False, f"Insufficient stock: {details}", {}
+
+            cursor.execute("""
+                UPDATE items
+                SET quantity = items.quantity - ri.quantity
+                FROM request_items AS ri
+                WHERE ri.item_id = items.id AND ri.request_id = ?
+                RETURNING items.id, items.quantity
+            """, (request_id,))
+            quantities = {item_id: quantity for item_id, quantity in cursor.fetchall()}
+            cursor.execute("""
+                INSERT INTO stock_movements (item_id, kind, quantity, request_id)
+                SELECT item_id, 'issue', -quantity, request_id FROM request_items WHERE request_id = ?
+            """, (request_id,))
             cursor.execute("""
                 UPDATE request 
-                SET status = ?, updated_at = CURRENT_TIMESTAMP, delivered_to = ? 
+                SET status = 'Admin Approved', updated_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            """, (request_id,))
+            # The decrement above turns the reservation into a real stock movement
+            cursor.execute("DELETE FROM stock_reservations WHERE request_id = ?", (request_id,))
+            _record_notification_event(cursor, request_id, "Admin Approved")
+            conn.commit()
+            bump_data_version(CATALOGUE)
+            bump_data_version(REQUESTS)
+            return True, "Request approved", quantities
+        except sqlite3.Error as e:
+            conn.rollback()
+            return False, f"Database error: {str(e)}", {}
+
+def delete_request(request_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM stock_reservations WHERE request_id = ?", (request_id,))
+            released = cursor.rowcount
+            cursor.execute("DELETE FROM request_items WHERE request_id = ?", (request_id,))
+            cursor.execute("DELETE FROM request WHERE id = ?", (request_id,))
+            deleted = cursor.rowcount > 0
+            conn.commit()
+            if released:
+                bump_data_version(CATALOGUE)
+            if deleted:
+                bump_data_version(REQUESTS)
+            return deleted
+        except sqlite3.Error:
+            conn.rollback()
+            return False
+
+# Statuses whose items have been issued from stock
+CONSUMED_STATUSES = ("Admin Approved", "Packing", "Dispatched", "Delivered")
+
+def get_consumption_records():
+    # One bulk read for analytics: (created_at, department, item_id, particular,
+    # quantity) for every line item of an issued request. Most requests end up
+    # issued, so CROSS JOIN keeps SQLite scanning request_items in order with
+    # primary key lookups instead of walking the status index.
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in CONSUMED_STATUSES)
+        cursor.execute(f"""
+            SELECT r.created_at, r.department, ri.item_id,
+                   COALESCE(i.particular, 'Item ' || ri.item_id), ri.quantity
+            FROM request_items ri
+            CROSS JOIN request r ON r.id = ri.request_id
+            LEFT JOIN items i ON i.id = ri.item_id
+            WHERE r.status IN ({placeholders})
+        """, CONSUMED_STATUSES)
+        return cursor.fetchall()
+
+def get_request_items(request_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT item_id, quantity FROM request_items WHERE request_id = ?", (request_id,))
+        items = [{"item_id": row[0], "quantity": row[1]} for row in cursor.fetchall()]
+        return items
+
+def get_request_item_details(request_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT ri.item_id, COALESCE(i.particular, 'Item #' || ri.item_id), ri.quantity
+            FROM request_items ri LEFT JOIN items i ON i.id = ri.item_id
+            WHERE ri.request_id = ?
+            ORDER BY ri.rowid
+        """, (request_id,))
+        return [{"item_id": row[0], "particular": row[1], "quantity": row[2]} for row in cursor.fetchall()]
+
+# Department-head digest events. Status changes append an event in the same
+# transaction; mail.send_department_digests() summarises the undigested
+# events per department and marks them digested.
+NOTIFICATION_EVENT_RETENTION_DAYS = 30
+
+def _record_notification_event(cursor, request_id, event):
+    cursor.execute("""
+        INSERT INTO notification_events (department, request_id, event)
+        SELECT department, id, ? FROM request WHERE id = ?
+    """, (event, request_id))
+
+def get_pending_notification_events():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT e.id, e.department, e.request_id, r.name, e.event, e.created_at
+            FROM notification_events e LEFT JOIN request r ON r.id = e.request_id
+            WHERE e.digested_at IS NULL
+            ORDER BY e.department, e.id
+        """)
+        return [{"id": row[0], "department": row[1], "request_id": row[2], "name": row[3] or "Deleted request",
+                 "event": row[4], "created_at": row[5]} for row in cursor.fetchall()]
+
+def mark_notification_events_digested(event_ids, to_email=None, subject=None, payload=None):
+    # Claims the events and, if to_email is given, queues their digest in the
+    # same transaction. Returns False without changing anything when another
+    # run (a second scheduler, the "Send Digests Now" button) already
+    # digested any of them, so a digest is never queued twice.
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.executemany("""
+                UPDATE notification_events SET digested_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND digested_at IS NULL
+            """, [(event_id,) for event_id in event_ids])
+            if cursor.rowcount != len(event_ids):
+                conn.rollback()
+                return False
+            if to_email is not None:
+                cursor.execute("INSERT INTO email_outbox (to_email, subject, payload) VALUES (?, ?, ?)",
+                               (to_email, subject, json.dumps(payload)))
+            cursor.execute("DELETE FROM notification_events WHERE digested_at < datetime('now', ?)",
+                           (f"-{NOTIFICATION_EVENT_RETENTION_DAYS} days",))
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+def get_pending_approval_counts():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT department, COUNT(*) FROM request
+            WHERE status = 'Pending Department Approval'
+            GROUP BY department
+        """)
+        return dict(cursor.fetchall())
+
+# Email outbox functions
+OUTBOX_STATUSES = ["queued", "sending", "sent", "failed"]
+
+def enqueue_email(to_email, subject, payload):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO email_outbox (to_email, subject, payload) VALUES (?, ?, ?)",
+                       (to_email, subject, json.dumps(payload)))
+        conn.commit()
+        return cursor.lastrowid
+
+def claim_due_emails(limit=10):
+    # Moves up to `limit` due messages from queued to sending so that only
+    # one worker delivers each of them
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT id, to_email, subject, payload, attempts
+                FROM email_outbox
+                WHERE status = 'queued' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            """, (limit,))
+            rows = cursor.fetchall()
+            cursor.executemany("UPDATE email_outbox SET status = 'sending', claimed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                               [(row[0],) for row in rows])
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        return [{"id": row[0], "to_email": row[1], "subject": row[2], "payload": json.loads(row[3]),
+                 "attempts": row[4]} for row in rows]
+
+def mark_email_sent(message_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE email_outbox
+            SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = ?
+        """, (message_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+def mark_email_failed(message_id, error, retry_in=None):
+    # retry_in: seconds until the next attempt, or None to give up
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if retry_in is None:
+            cursor.execute("""
+                UPDATE email_outbox
+                SET status = 'failed', attempts = attempts + 1, last_error = ?
                 WHERE id = ?
-            """, (status, delivered_to, request_id))
+            """, (error, message_id))
         else:
             cursor.execute("""
-                UPDATE request 
-                SET status = ?, updated_at = CURRENT_TIMESTAMP 
+                UPDATE email_outbox
+                SET status = 'queued', attempts = attempts + 1, last_error = ?,
+                    next_attempt_at = datetime('now', ?)
                 WHERE id = ?
-            """, (status, request_id))
+            """, (error, f"+{int(retry_in)} seconds", message_id))
         conn.commit()
-        return True, "Status updated"
-    except sqlite3.Error as e:
-        conn.rollback()
-        return False, f"Database error: {str(e)}"
-    finally:
-        conn.close()
+        return cursor.rowcount > 0
 
-def delete_request(request_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM request_items WHERE request_id = ?", (request_id,))
-        cursor.execute("DELETE FROM request WHERE id = ?", (request_id,))
+def requeue_stale_emails(lease_seconds):
+    # Puts back in the queue 'sending' messages claimed more than lease_seconds
+    # ago, i.e. left behind by a worker that stopped mid-delivery. Recent
+    # claims belong to a worker that may still be sending them.
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE email_outbox
+            SET status = 'queued', next_attempt_at = CURRENT_TIMESTAMP, claimed_at = NULL
+            WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at <= datetime('now', ?))
+        """, (f"-{int(lease_seconds)} seconds",))
         conn.commit()
-        return cursor.rowcount > 0
-    except sqlite3.Error:
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+        return cursor.rowcount
 
-def get_request_items(request_id):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT item_id, quantity FROM request_items WHERE request_id = ?", (request_id,))
-    items = [{"item_id": row[0], "quantity": row[1]} for row in cursor.fetchall()]
-    conn.close()
-    return items
+def requeue_emails(status="failed"):
+    # Puts every message with the given status back in the queue, e.g. the
+    # 'failed' ones an operator wants retried
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE email_outbox
+            SET status = 'queued', next_attempt_at = CURRENT_TIMESTAMP
+            WHERE status = ?
+        """, (status,))
+        conn.commit()
+        return cursor.rowcount
+
+def get_outbox_summary():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM email_outbox GROUP BY status")
+        summary = {status: 0 for status in OUTBOX_STATUSES}
+        summary.update(dict(cursor.fetchall()))
+        return summary
+
+def get_outbox_messages(status=None, limit=50):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if status:
+            cursor.execute("""
+                SELECT id, to_email, subject, status, attempts, next_attempt_at, last_error, created_at, sent_at
+                FROM email_outbox WHERE status = ? ORDER BY id DESC LIMIT ?
+            """, (status, limit))
+        else:
+            cursor.execute("""
+                SELECT id, to_email, subject, status, attempts, next_attempt_at, last_error, created_at, sent_at
+                FROM email_outbox ORDER BY id DESC LIMIT ?
+            """, (limit,))
+        return [{"id": row[0], "to_email": row[1], "subject": row[2], "status": row[3], "attempts": row[4],
+                 "next_attempt_at": row[5], "last_error": row[6], "created_at": row[7], "sent_at": row[8]}
+                for row in cursor.fetchall()]
 
 # Placeholder for department emails
 def get_department_emails():
@@ -403,10 +1701,19 @@ def get_department_emails():
 def update_department_email(department, email):
     return True
 
-# Initialize database
-init_db()
+# Infrastructure and instrumentation functions are left unwrapped
+_NOT_INSTRUMENTED = {
+    "connection_pragmas", "configure_pool", "bump_data_version", "get_data_version", "get_pool",
+    "get_connection", "get_pool_stats", "page_cursor", "instrumented", "configure_query_stats",
+    "get_query_stats", "reset_query_stats", "dump_query_stats",
+}
+for _name, _function in list(globals().items()):
+    if (inspect.isfunction(_function) and _function.__module__ == __name__
+            and not _name.startswith("_") and _name not in _NOT_INSTRUMENTED):
+        globals()[_name] = instrumented(_function)
 
 if __name__ == "__main__":
+    init_db()
     print("Database initialized.")
     # Test item retrieval
     items = get_all_items()
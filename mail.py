@@ -1,9 +1,98 @@
+import os
 import smtplib
+import threading
+import time
+from html import escape
+from string import Template
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email_validator import validate_email, EmailNotValidError
 
-def send_email(to_email, admin_name, subject, body, request_details=None, delivered_to=None, delivery_time=None):
+import database
+
+# SMTP relay settings, overridable per deployment
+SMTP_HOST = os.environ.get("INVENTORY_SMTP_HOST", "10.64.4.200")
+SMTP_PORT = int(os.environ.get("INVENTORY_SMTP_PORT", "25"))
+SMTP_USE_TLS = os.environ.get("INVENTORY_SMTP_USE_TLS", "1") != "0"
+SMTP_FROM = os.environ.get("INVENTORY_SMTP_FROM", "Halol.Admin@ceat.com")
+SMTP_PASSWORD = os.environ.get("INVENTORY_SMTP_PASSWORD", "khmpqsrfxgspjswk")
+SMTP_TIMEOUT = float(os.environ.get("INVENTORY_SMTP_TIMEOUT", "30"))
+
+# SMTP session reuse settings
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100   # Reconnect after this many messages
+SMTP_NOOP_AFTER = 30.0                   # Seconds idle before the connection is checked with NOOP
+SMTP_IDLE_TIMEOUT = 240.0                # Seconds idle before the connection is closed instead of checked
+BULK_CHUNK_SIZE = 50                     # Recipients per SMTP transaction in send_bulk_email
+
+# Address validation settings. With offline validation only the syntax is
+# checked; otherwise write-time checks also look up the domain's MX records.
+EMAIL_OFFLINE_VALIDATION = os.environ.get("INVENTORY_EMAIL_OFFLINE_VALIDATION", "0") == "1"
+EMAIL_VALIDATION_TTL = float(os.environ.get("INVENTORY_EMAIL_VALIDATION_TTL", "86400"))
+EMAIL_VALIDATION_DNS_TIMEOUT = 5     # Seconds per DNS lookup when checking deliverability
+EMAIL_VALIDATION_CACHE_SIZE = 4096   # Addresses kept before the oldest results are dropped
+
+# Outbox delivery settings
+OUTBOX_POLL_INTERVAL = 5.0    # Seconds between checks for due messages
+OUTBOX_BATCH_SIZE = 20        # Messages claimed per pass
+OUTBOX_MAX_ATTEMPTS = 6       # Attempts before a message is marked failed
+OUTBOX_BACKOFF_BASE = 30      # Seconds before the first retry, doubled on every further attempt
+OUTBOX_BACKOFF_MAX = 3600     # Upper bound for the retry delay
+OUTBOX_SENDING_LEASE = 900    # Seconds a claimed message may stay 'sending' before another worker requeues it
+
+# Department-head digest settings
+DIGEST_WINDOW = float(os.environ.get("INVENTORY_DIGEST_WINDOW", "3600"))   # Seconds between digests
+
+_validation_cache = {}
+_validation_cache_lock = threading.Lock()
+
+def check_email_address(address, check_deliverability=None):
+    """
+    Validate an email address, reusing results cached within EMAIL_VALIDATION_TTL.
+
+    Args:
+        address (str): Address to validate.
+        check_deliverability (bool, optional): Look up the domain in DNS. Defaults
+            to the opposite of EMAIL_OFFLINE_VALIDATION.
+
+    Returns:
+        str: The normalized address.
+
+    Raises:
+        EmailNotValidError: If the address is invalid (cached failures are raised again).
+    """
+    if check_deliverability is None:
+        check_deliverability = not EMAIL_OFFLINE_VALIDATION
+    key = (address, check_deliverability)
+    now = time.monotonic()
+    with _validation_cache_lock:
+        cached = _validation_cache.get(key)
+    if cached is not None and cached[0] > now:
+        _, normalized, error = cached
+    else:
+        try:
+            normalized = validate_email(
+                address,
+                check_deliverability=check_deliverability,
+                timeout=EMAIL_VALIDATION_DNS_TIMEOUT
+            ).normalized
+            error = None
+        except EmailNotValidError as e:
+            normalized, error = None, str(e)
+        with _validation_cache_lock:
+            if len(_validation_cache) >= EMAIL_VALIDATION_CACHE_SIZE:
+                _validation_cache.pop(next(iter(_validation_cache)))
+            _validation_cache[key] = (now + EMAIL_VALIDATION_TTL, normalized, error)
+    if error is not None:
+        raise EmailNotValidError(error)
+    return normalized
+
+def clear_email_validation_cache():
+    """Forget every cached validation result."""
+    with _validation_cache_lock:
+        _validation_cache.clear()
+
+def send_email(to_email, admin_name, subject, body, request_details=None, delivered_to=None, delivery_time=None,
+               html_content=None):
     """
     Send an email using Gmail SMTP with dynamic content based on the subject.
     
@@ -15,6 +104,7 @@ def send_email(to_email, admin_name, subject, body, request_details=None, delive
         request_details (dict, optional): Details of the request (name, email, description).
         delivered_to (str, optional): Delivery recipient name (for "Delivered" emails).
         delivery_time (str, optional): Delivery time (for "Delivered" emails).
+        html_content (str, optional): Pre-rendered HTML, used instead of the templates.
     
     Returns:
         bool: True if email is sent successfully.
@@ -22,177 +112,653 @@ def send_email(to_email, admin_name, subject, body, request_details=None, delive
     Raises:
         Exception: If email validation or sending fails.
     """
-    # Gmail credentials
-    from_email = 'Halol.Admin@ceat.com'  
-    password ='khmpqsrfxgspjswk'  
+    from_email = SMTP_FROM
 
-    # Validate recipient email
+    # Addresses were checked (including DNS) when they were saved; only the syntax is checked here
     try:
-        validate_email(to_email)
+        check_email_address(to_email, check_deliverability=False)
     except EmailNotValidError as e:
-        raise Exception(f"Invalid email address: {e}")
-
-    # Generate HTML content based on request details and subject
-    if request_details:
-        name = request_details.get('name', 'User')
-        email = request_details.get('email', 'N/A')
-        description = request_details.get('description', 'N/A')
-
-        # Parse items from description
-        items = []
-        if description and description != 'N/A':
-            item_entries = description.split(", ")
-            for entry in item_entries:
-                try:
-                    item_name, qty_part = entry.split(" (Qty: ")
-                    quantity = qty_part.rstrip(")")
-                    items.append({"name": item_name, "quantity": quantity})
-                except ValueError:
-                    items.append({"name": entry, "quantity": "N/A"})
-
-        # Create items table
-        items_table = """
-        <table border="1" cellpadding="5" style="border-collapse: collapse; width: 50%;">
-            <tr>
-                <th>Item</th>
-                <th>Quantity</th>
-            </tr>
+        raise Exception(f"Invalid email address: {e}") from e
+
+    if html_content is None:
+        html_content = render_email_html(admin_name, subject, body, request_details, delivered_to, delivery_time)
+
+    # Set up email message
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg.attach(MIMEText(html_content, 'html'))
+
+    # Send email over the shared SMTP session
+    try:
+        get_smtp_session().sendmail(from_email, to_email, msg.as_string())
+        return True
+    except smtplib.SMTPAuthenticationError as e:
+        raise Exception(f"SMTP Authentication Error: {e}") from e
+    except Exception as e:
+        raise Exception(f"Error sending email: {e}") from e
+
+class SMTPSession:
+    """
+    Authenticated SMTP connection reused across messages.
+
+    The connection is opened on first use, checked with NOOP when it has been
+    idle for SMTP_NOOP_AFTER seconds, reopened when the server has dropped it
+    and closed after max_messages messages. Sends are serialised by a lock, so
+    one session can be shared by the outbox worker and Streamlit sessions.
+    """
+
+    def __init__(self, host=None, port=None, use_tls=None, username=None, password=None,
+                 timeout=None, max_messages=None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.use_tls = SMTP_USE_TLS if use_tls is None else use_tls
+        self.username = SMTP_FROM if username is None else username
+        self.password = SMTP_PASSWORD if password is None else password
+        self.timeout = timeout or SMTP_TIMEOUT
+        self.max_messages = max_messages or SMTP_MAX_MESSAGES_PER_CONNECTION
+        self._server = None
+        self._sent_on_connection = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"connects": 0, "reconnects": 0, "noops": 0, "messages": 0}
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._sent_on_connection = 0
+        self._stats["connects"] += 1
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                self._server.close()
+            self._server = None
+
+    def _is_alive(self):
+        try:
+            self._stats["noops"] += 1
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _ensure_connection(self):
+        if self._server is not None:
+            idle = time.monotonic() - self._last_used
+            if idle > SMTP_IDLE_TIMEOUT or (idle > SMTP_NOOP_AFTER and not self._is_alive()):
+                self._disconnect()
+        if self._server is None:
+            self._connect()
+
+    def sendmail(self, from_addr, to_addrs, message):
         """
-        for item in items:
-            items_table += f"""
-            <tr>
-                <td>{item['name']}</td>
-                <td>{item['quantity']}</td>
-            </tr>
-            """
-        items_table += "</table>"
-
-        # Email templates based on subject
-        if "approved" in subject.lower():
-            html_content = f"""
-            <html>
-                <body>
-                    <h3>Hello {name},</h3>
-                    <p>We are pleased to inform you that your request has been approved.</p>
-                    <p>Details of the approved request:</p>
+        Send one message, reconnecting once if the server dropped the connection.
+
+        Args:
+            from_addr (str): Envelope sender.
+            to_addrs (str or list): Envelope recipient(s).
+            message (str): Complete message including headers.
+
+        Returns:
+            dict: Refused recipients, as returned by smtplib.SMTP.sendmail.
+        """
+        with self._lock:
+            self._ensure_connection()
+            try:
+                refused = self._server.sendmail(from_addr, to_addrs, message)
+            except smtplib.SMTPServerDisconnected:
+                self._server.close()
+                self._server = None
+                self._connect()
+                self._stats["reconnects"] += 1
+                refused = self._server.sendmail(from_addr, to_addrs, message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The server rejected this message; the connection itself is still usable
+                self._last_used = time.monotonic()
+                raise
+            except Exception:
+                self._disconnect()
+                raise
+            self._stats["messages"] += 1
+            self._sent_on_connection += 1
+            self._last_used = time.monotonic()
+            if self._sent_on_connection >= self.max_messages:
+                self._disconnect()
+            return refused
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, connected=self._server is not None)
+
+_smtp_session = None
+_smtp_session_lock = threading.Lock()
+
+def get_smtp_session():
+    """
+    Return the process-wide SMTP session, creating it on first use.
+
+    Returns:
+        SMTPSession: The shared session.
+    """
+    global _smtp_session
+    with _smtp_session_lock:
+        if _smtp_session is None:
+            _smtp_session = SMTPSession()
+        return _smtp_session
+
+def close_smtp_session():
+    """Close the process-wide SMTP session; the next send opens a new one."""
+    global _smtp_session
+    with _smtp_session_lock:
+        if _smtp_session is not None:
+            _smtp_session.close()
+            _smtp_session = None
+
+# Email templates, compiled once at import. Placeholders are filled with
+# HTML-escaped values by render_email_html.
+REQUEST_SUMMARY_TEMPLATE = Template("""
                     <table border="1" cellpadding="5">
                         <tr>
                             <th>Name</th>
                             <th>Email</th>
                         </tr>
                         <tr>
-                            <td>{name}</td>
-                            <td>{email}</td>
+                            <td>$name</td>
+                            <td>$email</td>
                         </tr>
-                    </table>
+                    </table>""")
+
+ITEMS_TABLE_TEMPLATE = Template("""
+        <table border="1" cellpadding="5" style="border-collapse: collapse; width: 50%;">
+            <tr>
+                <th>Item</th>
+                <th>Quantity</th>
+            </tr>$rows
+        </table>""")
+
+ITEM_ROW_TEMPLATE = Template("""
+            <tr>
+                <td>$name</td>
+                <td>$quantity</td>
+            </tr>""")
+
+EMAIL_TEMPLATES = {
+    "approved": Template("""
+            <html>
+                <body>
+                    <h3>Hello $name,</h3>
+                    <p>We are pleased to inform you that your request has been approved.</p>
+                    <p>Details of the approved request:</p>$summary
                     <h4>Items Approved:</h4>
-                    {items_table}
-                    <p><strong>Approved by:</strong> {admin_name}</p>
+                    $items_table
+                    <p><strong>Approved by:</strong> $admin_name</p>
                     <p>We will notify you once the items are ready for pickup.</p>
                 </body>
             </html>
-            """
-        elif "rejected" in subject.lower():
-            html_content = f"""
+            """),
+    "rejected": Template("""
             <html>
                 <body>
-                    <h3>Hello {name},</h3>
+                    <h3>Hello $name,</h3>
                     <p>We regret to inform you that your request has been rejected.</p>
-                    <p>Details of the rejected request:</p>
-                    <table border="1" cellpadding="5">
-                        <tr>
-                            <th>Name</th>
-                            <th>Email</th>
-                        </tr>
-                        <tr>
-                            <td>{name}</td>
-                            <td>{email}</td>
-                        </tr>
-                    </table>
+                    <p>Details of the rejected request:</p>$summary
                     <h4>Items Requested:</h4>
-                    {items_table}
-                    <p><strong>Rejected by:</strong> {admin_name}</p>
+                    $items_table
+                    <p><strong>Rejected by:</strong> $admin_name</p>
                     <p>Contact support for clarification if needed.</p>
                 </body>
             </html>
-            """
-        elif "delivered" in subject.lower() and delivered_to and delivery_time:
-            html_content = f"""
+            """),
+    "delivered": Template("""
             <html>
                 <body>
-                    <h3>Hello {name},</h3>
-                    <p>Your request has been delivered to <strong>{delivered_to}</strong> on <strong>{delivery_time}</strong>.</p>
-                    <p>Details of the delivered request:</p>
-                    <table border="1" cellpadding="5">
-                        <tr>
-                            <th>Name</th>
-                            <th>Email</th>
-                        </tr>
-                        <tr>
-                            <td>{name}</td>
-                            <td>{email}</td>
-                        </tr>
-                    </table>
+                    <h3>Hello $name,</h3>
+                    <p>Your request has been delivered to <strong>$delivered_to</strong> on <strong>$delivery_time</strong>.</p>
+                    <p>Details of the delivered request:</p>$summary
                     <h4>Items Delivered:</h4>
-                    {items_table}
-                    <p><strong>Processed by:</strong> {admin_name}</p>
+                    $items_table
+                    <p><strong>Processed by:</strong> $admin_name</p>
                     <p>Contact us at 9999999999 if you can't receive the item.</p>
                 </body>
             </html>
-            """
-        else:
-            html_content = f"""
+            """),
+    "generic": Template("""
             <html>
                 <body>
-                    <h3>Hello {name},</h3>
-                    <p>{body}</p>
-                    <p>Request details:</p>
-                    <table border="1" cellpadding="5">
-                        <tr>
-                            <th>Name</th>
-                            <th>Email</th>
-                        </tr>
-                        <tr>
-                            <td>{name}</td>
-                            <td>{email}</td>
-                        </tr>
-                    </table>
+                    <h3>Hello $name,</h3>
+                    <p>$body</p>
+                    <p>Request details:</p>$summary
                     <h4>Items Requested:</h4>
-                    {items_table}
+                    $items_table
                     <p><strong>Processed by:</strong> System</p>
                     <p>You will be notified once your request is reviewed.</p>
                 </body>
             </html>
-            """
-    else:
-        # Custom email without request details
-        html_content = f"""
+            """),
+    "custom": Template("""
         <html>
             <body>
-                <p>{body}</p>
-                <p>Best regards,<br>{admin_name}</p>
+                <p>$body</p>
+                <p>Best regards,<br>$admin_name</p>
             </body>
         </html>
-        """
+        """),
+}
+
+DIGEST_TEMPLATE = Template("""
+        <html>
+            <body>
+                <h3>$department: request summary</h3>
+                <p>$event_count request updates since the last summary.
+                   <strong>$pending_count</strong> requests are waiting for your approval.</p>
+                <table border="1" cellpadding="5" style="border-collapse: collapse;">
+                    <tr>
+                        <th>Request</th>
+                        <th>Name</th>
+                        <th>Status</th>
+                        <th>Time</th>
+                    </tr>$rows
+                </table>
+                <p>Open the Department Head Dashboard to review pending requests.</p>
+            </body>
+        </html>
+        """)
+
+DIGEST_ROW_TEMPLATE = Template("""
+                    <tr>
+                        <td>$request_id</td>
+                        <td>$name</td>
+                        <td>$event</td>
+                        <td>$created_at</td>
+                    </tr>""")
+
+def select_template(subject, request_details=None, delivered_to=None, delivery_time=None):
+    """
+    Choose the template for a message, using the same rules as before templates existed.
+
+    Returns:
+        str: A key of EMAIL_TEMPLATES.
+    """
+    if not request_details:
+        return "custom"
+    subject = subject.lower()
+    if "approved" in subject:
+        return "approved"
+    if "rejected" in subject:
+        return "rejected"
+    if "delivered" in subject and delivered_to and delivery_time:
+        return "delivered"
+    return "generic"
+
+def _items_from_description(description):
+    # Fallback for request_details without a request id: parse "Item (Qty: n), ..."
+    items = []
+    if description and description != 'N/A':
+        for entry in description.split(", "):
+            try:
+                item_name, qty_part = entry.split(" (Qty: ")
+                items.append({"particular": item_name, "quantity": qty_part.rstrip(")")})
+            except ValueError:
+                items.append({"particular": entry, "quantity": "N/A"})
+    return items
+
+def request_items_for(request_details):
+    """
+    Items of a request, from request_details["items"], the request_items table or,
+    for details without a request id, the free-text description.
+
+    Returns:
+        list: Dictionaries with particular and quantity.
+    """
+    if request_details.get("items") is not None:
+        return request_details["items"]
+    request_id = request_details.get("id")
+    if isinstance(request_id, int):
+        return database.get_request_item_details(request_id)
+    return _items_from_description(request_details.get("description", "N/A"))
+
+def _html(value):
+    return escape(str(value)).replace("\n", "<br>")
+
+def render_digest_html(department, events, pending_count):
+    """
+    Render the digest email for one department.
+
+    Args:
+        department (str): Department name.
+        events (list): Events from database.get_pending_notification_events for this department.
+        pending_count (int): Requests currently pending department approval.
+
+    Returns:
+        str: The HTML content.
+    """
+    rows = "".join(
+        DIGEST_ROW_TEMPLATE.substitute(
+            request_id=_html(event["request_id"]),
+            name=_html(event["name"]),
+            event=_html(event["event"]),
+            created_at=_html(event["created_at"])
+        )
+        for event in events
+    )
+    return DIGEST_TEMPLATE.substitute(
+        department=_html(department),
+        event_count=len(events),
+        pending_count=pending_count,
+        rows=rows
+    )
+
+def render_email_html(admin_name, subject, body, request_details=None, delivered_to=None, delivery_time=None):
+    """
+    Render the HTML body of a notification email from the precompiled templates.
+
+    Args:
+        Same as send_email, without the recipient. request_details may carry an
+        "items" list of {particular, quantity}; otherwise the items are read from
+        request_items using request_details["id"].
+
+    Returns:
+        str: The HTML content.
+    """
+    kind = select_template(subject, request_details, delivered_to, delivery_time)
+    values = {"admin_name": _html(admin_name), "body": _html(body)}
+    if kind != "custom":
+        name = _html(request_details.get('name', 'User'))
+        rows = "".join(
+            ITEM_ROW_TEMPLATE.substitute(name=_html(item["particular"]), quantity=_html(item["quantity"]))
+            for item in request_items_for(request_details)
+        )
+        values.update(
+            name=name,
+            summary=REQUEST_SUMMARY_TEMPLATE.substitute(name=name, email=_html(request_details.get('email', 'N/A'))),
+            items_table=ITEMS_TABLE_TEMPLATE.substitute(rows=rows),
+            delivered_to=_html(delivered_to),
+            delivery_time=_html(delivery_time),
+        )
+    return EMAIL_TEMPLATES[kind].substitute(values)
+
+def send_bulk_email(recipients, admin_name, subject, body, chunk_size=BULK_CHUNK_SIZE, progress=None):
+    """
+    Send one message to many recipients over the shared SMTP session.
+
+    Addresses get a cached syntax-only check. The message is rendered once
+    and sent in chunks of chunk_size envelope recipients (BCC: the To header
+    shows only the sender), so one refused address or failed chunk does not
+    stop the rest of the broadcast.
+
+    Args:
+        recipients (iterable): Recipient email addresses; duplicates are sent once.
+        admin_name (str): Name of the sender (e.g., "Admin").
+        subject (str): Email subject line.
+        body (str): Email body text.
+        chunk_size (int, optional): Recipients per SMTP transaction.
+        progress (callable, optional): Called as progress(done, total) after every chunk.
+
+    Returns:
+        tuple: (sent, failed) where sent is a list of addresses and failed maps
+        each failed address to the reason.
+    """
+    from_email = SMTP_FROM
+    sent, failed = [], {}
+
+    valid = []
+    for address in dict.fromkeys(recipients):
+        try:
+            check_email_address(address, check_deliverability=False)
+            valid.append(address)
+        except EmailNotValidError as e:
+            failed[address] = f"Invalid email address: {e}"
 
-    # Set up email message
     msg = MIMEMultipart()
     msg['Subject'] = subject
     msg['From'] = from_email
-    msg['To'] = to_email
-    msg.attach(MIMEText(html_content, 'html'))
+    msg['To'] = from_email
+    msg.attach(MIMEText(render_email_html(admin_name, subject, body), 'html'))
+    message = msg.as_string()
 
-    # Send email via SMTP
-    try:
-        with smtplib.SMTP('10.64.4.200', 25) as server:
-            server.starttls()
-            server.login(from_email, password)
-            server.sendmail(from_email, to_email, msg.as_string())
+    session = get_smtp_session()
+    total = len(valid)
+    for offset in range(0, total, chunk_size):
+        chunk = valid[offset:offset + chunk_size]
+        try:
+            refused = session.sendmail(from_email, chunk, message)
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
+        except Exception as e:
+            refused = {address: str(e) for address in chunk}
+        for address in chunk:
+            if address in refused:
+                reason = refused[address]
+                if isinstance(reason, tuple):
+                    code, text = reason
+                    reason = f"{code} {text.decode(errors='replace') if isinstance(text, bytes) else text}"
+                failed[address] = reason
+            else:
+                sent.append(address)
+        if progress is not None:
+            progress(min(offset + chunk_size, total), total)
+    return sent, failed
+
+def queue_email(to_email, admin_name, subject, body, request_details=None, delivered_to=None, delivery_time=None):
+    """
+    Queue an email in the outbox for background delivery.
+
+    Takes the same arguments as send_email and returns immediately; the
+    OutboxWorker sends the message with retries.
+
+    Returns:
+        int: ID of the outbox message.
+    """
+    payload = {
+        "to_email": to_email,
+        "admin_name": admin_name,
+        "subject": subject,
+        "body": body,
+        "request_details": request_details,
+        "delivered_to": delivered_to,
+        "delivery_time": delivery_time,
+    }
+    message_id = database.enqueue_email(to_email, subject, payload)
+    if _outbox_worker is not None:
+        _outbox_worker.wake()
+    return message_id
+
+def retry_delay(attempts):
+    """
+    Exponential backoff for the next delivery attempt.
+
+    Args:
+        attempts (int): Attempts made so far, including the one that just failed.
+
+    Returns:
+        float: Seconds to wait, or None once OUTBOX_MAX_ATTEMPTS is reached.
+    """
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        return None
+    return min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+
+def is_permanent_failure(error):
+    """
+    Whether a send_email error would fail the same way on every retry.
+
+    Invalid addresses, rejected SMTP credentials and recipients refused with a
+    5xx reply are permanent; timeouts, dropped connections and 4xx replies are
+    retried.
+
+    Args:
+        error (Exception): Exception raised by send_email (the original error is its __cause__).
+
+    Returns:
+        bool: True if the message should be marked failed without retrying.
+    """
+    cause = error.__cause__ or error
+    if isinstance(cause, (EmailNotValidError, smtplib.SMTPAuthenticationError)):
         return True
-    except smtplib.SMTPAuthenticationError as e:
-        raise Exception(f"SMTP Authentication Error: {e}")
-    except Exception as e:
-        raise Exception(f"Error sending email: {e}")
+    if isinstance(cause, smtplib.SMTPRecipientsRefused):
+        return bool(cause.recipients) and all(code >= 500 for code, _ in cause.recipients.values())
+    return False
+
+def deliver_due_emails(limit=OUTBOX_BATCH_SIZE):
+    """
+    Send every outbox message that is due, once.
+
+    Returns:
+        tuple: (sent, failed) counts for this pass.
+    """
+    sent = failed = 0
+    for message in database.claim_due_emails(limit):
+        try:
+            send_email(**message["payload"])
+            database.mark_email_sent(message["id"])
+            sent += 1
+        except Exception as e:
+            retry_in = None if is_permanent_failure(e) else retry_delay(message["attempts"] + 1)
+            database.mark_email_failed(message["id"], str(e), retry_in)
+            failed += 1
+    return sent, failed
+
+class OutboxWorker(threading.Thread):
+    """Background thread that delivers queued outbox messages."""
+
+    def __init__(self, poll_interval=OUTBOX_POLL_INTERVAL):
+        super().__init__(name="email-outbox-worker", daemon=True)
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def run(self):
+        last_requeue = None
+        while not self._stop_event.is_set():
+            try:
+                # Messages whose worker stopped mid-delivery; claims younger than the
+                # lease may belong to a worker in another process that is still sending
+                if last_requeue is None or time.monotonic() - last_requeue >= OUTBOX_SENDING_LEASE:
+                    database.requeue_stale_emails(OUTBOX_SENDING_LEASE)
+                    last_requeue = time.monotonic()
+                sent, failed = deliver_due_emails()
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+                sent = failed = 0
+            if sent + failed < OUTBOX_BATCH_SIZE:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+_outbox_worker = None
+_outbox_worker_lock = threading.Lock()
+
+def start_outbox_worker():
+    """
+    Start the process-wide outbox worker if it is not already running.
+
+    Returns:
+        OutboxWorker: The running worker.
+    """
+    global _outbox_worker
+    with _outbox_worker_lock:
+        if _outbox_worker is None or not _outbox_worker.is_alive():
+            _outbox_worker = OutboxWorker()
+            _outbox_worker.start()
+        return _outbox_worker
+
+def send_department_digests():
+    """
+    Queue one summary email per department head covering every undigested request event.
+
+    Events of departments without a head email are marked digested without a message. Each
+    department's events are claimed in the same transaction that queues its digest, so concurrent
+    runs (another process's scheduler, the "Send Digests Now" button) never queue the same events twice.
+
+    Returns:
+        int: Number of digest emails queued.
+    """
+    events = database.get_pending_notification_events()
+    if not events:
+        return 0
+    heads = database.get_all_department_heads()
+    pending_counts = database.get_pending_approval_counts()
+    by_department = {}
+    for event in events:
+        by_department.setdefault(event["department"], []).append(event)
+
+    queued = 0
+    for department, department_events in by_department.items():
+        event_ids = [event["id"] for event in department_events]
+        head_email = heads.get(department, {}).get("email")
+        if not head_email:
+            database.mark_notification_events_digested(event_ids)
+            continue
+        subject = f"{department}: {len(department_events)} request updates"
+        html_content = render_digest_html(department, department_events, pending_counts.get(department, 0))
+        # Claiming the events and queueing the email is one transaction, so a concurrent
+        # run that read the same events skips them instead of queueing a duplicate
+        if database.mark_notification_events_digested(event_ids, head_email, subject, {
+            "to_email": head_email,
+            "admin_name": "System",
+            "subject": subject,
+            "body": "",
+            "html_content": html_content,
+        }):
+            queued += 1
+    if queued and _outbox_worker is not None:
+        _outbox_worker.wake()
+    return queued
+
+class DigestScheduler(threading.Thread):
+    """Background thread that queues department-head digests every DIGEST_WINDOW seconds."""
+
+    def __init__(self, window=DIGEST_WINDOW):
+        super().__init__(name="email-digest-scheduler", daemon=True)
+        self.window = window
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.window):
+            try:
+                send_department_digests()
+            except Exception as e:
+                print(f"Digest scheduler error: {e}")
+
+_digest_scheduler = None
+_digest_scheduler_lock = threading.Lock()
+
+def start_digest_scheduler():
+    """
+    Start the process-wide digest scheduler if it is not already running.
+
+    Returns:
+        DigestScheduler: The running scheduler.
+    """
+    global _digest_scheduler
+    with _digest_scheduler_lock:
+        if _digest_scheduler is None or not _digest_scheduler.is_alive():
+            _digest_scheduler = DigestScheduler()
+            _digest_scheduler.start()
+        return _digest_scheduler
 
 if __name__ == "__main__":
     # Test the function
@@ -201,4 +767,4 @@ if __name__ == "__main__":
         admin_name="Admin",
         subject="Test Email",
         body="This is a test email."
-    )
\ No newline at end of file
+    )
\ No newline at end of file
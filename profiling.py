@@ -0,0 +1,225 @@
+import cProfile
+import functools
+import io
+import itertools
+import marshal
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Profiling is opt-in: INVENTORY_PROFILING=1 or the super admin Diagnostics toggle
+PROFILING_ENABLED = os.environ.get("INVENTORY_PROFILING", "0") == "1"
+PROFILE_HISTORY_SIZE = int(os.environ.get("INVENTORY_PROFILE_HISTORY", "50"))   # Recent reruns kept
+PROFILE_KEEP_SLOWEST = int(os.environ.get("INVENTORY_PROFILE_KEEP_SLOWEST", "5"))  # Reruns whose cProfile data is kept
+
+
+class RerunProfile:
+    """Timings of one script run: named sections and calls into other modules."""
+
+    def __init__(self, run_id, page):
+        self.run_id = run_id
+        self.page = page
+        self.started_at = datetime.now(timezone.utc)
+        self.total_ms = 0.0
+        self.outcome = "completed"
+        self.sections = []   # (name, ms) in the order they finished
+        self.calls = {}      # name -> [count, total ms]
+        self.profile = None  # cProfile.Profile, kept only for the slowest runs
+
+    def record_call(self, name, elapsed_ms):
+        entry = self.calls.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed_ms
+
+    def summary(self):
+        """Returns the run as a JSON-serialisable dict."""
+        return {
+            "run_id": self.run_id,
+            "page": self.page,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "total_ms": round(self.total_ms, 3),
+            "outcome": self.outcome,
+            "sections": [{"name": name, "ms": round(ms, 3)} for name, ms in self.sections],
+            "calls": [{"name": name, "count": count, "ms": round(ms, 3)}
+                      for name, (count, ms) in sorted(self.calls.items(), key=lambda item: -item[1][1])],
+            "has_profile": self.profile is not None,
+        }
+
+
+class RerunProfiler:
+    """Collects a RerunProfile per script run while profiling is enabled.
+
+    Each Streamlit session runs the script in its own thread, so the active run
+    is thread-local and concurrent sessions do not mix their timings.
+    """
+
+    def __init__(self, enabled=PROFILING_ENABLED, history_size=PROFILE_HISTORY_SIZE,
+                 keep_slowest=PROFILE_KEEP_SLOWEST):
+        self.enabled = enabled
+        self.keep_slowest = keep_slowest
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history_size)
+        self._slowest = []   # RerunProfiles holding cProfile data, slowest first
+        self._ids = itertools.count(1)
+
+    def current(self):
+        """Returns the RerunProfile of the calling thread's script run, or None."""
+        return getattr(self._local, "run", None)
+
+    @contextmanager
+    def run(self, page):
+        """Profiles one script run if profiling is enabled.
+
+        Args:
+            page (str): Page being rendered.
+
+        Yields:
+            RerunProfile or None: The run being recorded.
+        """
+        if not self.enabled or self.current() is not None:
+            yield None
+            return
+        run = RerunProfile(next(self._ids), page)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread
+            profile = None
+        self._local.run = run
+        start = time.perf_counter()
+        try:
+            yield run
+        except BaseException as e:
+            # st.rerun() and st.stop() end the run with an exception too
+            run.outcome = type(e).__name__
+            raise
+        finally:
+            run.total_ms = (time.perf_counter() - start) * 1000
+            if profile is not None:
+                profile.disable()
+            self._local.run = None
+            self._store(run, profile)
+
+    def _store(self, run, profile):
+        with self._lock:
+            self._history.append(run)
+            if profile is None or self.keep_slowest <= 0:
+                return
+            if len(self._slowest) < self.keep_slowest or run.total_ms > self._slowest[-1].total_ms:
+                run.profile = profile
+                self._slowest.append(run)
+                self._slowest.sort(key=lambda kept: -kept.total_ms)
+                for dropped in self._slowest[self.keep_slowest:]:
+                    dropped.profile = None
+                del self._slowest[self.keep_slowest:]
+
+    @contextmanager
+    def section(self, name):
+        """Times a named part of the current run; does nothing when no run is being profiled."""
+        run = self.current()
+        if run is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            run.sections.append((name, (time.perf_counter() - start) * 1000))
+
+    def timed(self, function, name=None):
+        """Wraps function so calls made during a profiled run are recorded under name.
+
+        Args:
+            function (callable): Function to wrap.
+            name (str, optional): Label; defaults to module.function.
+
+        Returns:
+            callable: The wrapper, which only costs a thread-local lookup when no run is active.
+        """
+        label = name or f"{function.__module__}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            run = getattr(self._local, "run", None)
+            if run is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                run.record_call(label, (time.perf_counter() - start) * 1000)
+
+        return wrapper
+
+    def wrap_namespace(self, namespace, modules=(), names=()):
+        """Replaces functions in namespace (e.g. a module's globals()) with timed wrappers.
+
+        Args:
+            namespace (dict): Namespace to modify in place.
+            modules (tuple): Wrap every function imported from these modules.
+            names (tuple): Also wrap these names, e.g. helpers defined in the namespace itself;
+                they are recorded under their bare name.
+        """
+        for key, value in list(namespace.items()):
+            if not callable(value) or isinstance(value, type) or key.startswith("_"):
+                continue
+            if key in names:
+                namespace[key] = self.timed(value, key)
+            elif getattr(value, "__module__", None) in modules:
+                namespace[key] = self.timed(value)
+
+    def recent_runs(self):
+        """Returns summaries of the recent runs, newest first."""
+        with self._lock:
+            runs = list(self._history)
+        return [run.summary() for run in reversed(runs)]
+
+    def slowest_runs(self):
+        """Returns summaries of the runs whose cProfile data is kept, slowest first."""
+        with self._lock:
+            return [run.summary() for run in self._slowest]
+
+    def _kept_profile(self, run_id):
+        with self._lock:
+            for run in self._slowest:
+                if run.run_id == run_id:
+                    return run.profile
+        return None
+
+    def export_pstats(self, run_id):
+        """Returns the cProfile data of a kept run in pstats file format (load with pstats.Stats(path)).
+
+        Args:
+            run_id (int): Run to export.
+
+        Returns:
+            bytes: The marshalled stats, or None if the run's profile is not kept.
+        """
+        profile = self._kept_profile(run_id)
+        if profile is None:
+            return None
+        return marshal.dumps(pstats.Stats(profile).stats)
+
+    def format_pstats(self, run_id, sort="cumulative", limit=40):
+        """Returns a kept run's cProfile data as pstats text, or None if it is not kept."""
+        profile = self._kept_profile(run_id)
+        if profile is None:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).strip_dirs().sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def clear(self):
+        """Forgets every recorded run."""
+        with self._lock:
+            self._history.clear()
+            self._slowest.clear()
+
+
+profiler = RerunProfiler()